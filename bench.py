@@ -0,0 +1,582 @@
+"""Repeatable benchmarks of the analysis on synthetic workbooks and a replayed Census API.
+
+``synthetic_workbook`` writes a workbook with the layout of the three USDA
+sheets the analysis reads (title row, merged first-level headers, secondary
+headers with footnote marks and spacer columns, year-to-date rows on top,
+months newest first, a year of quarter-end totals 40 years back, footnotes
+and the source line below) with ``history`` times as many months and
+``columns`` times as many columns in every header block. The added columns
+are read too, so the transformations and the merge get wider as well.
+
+The Census sweeps, the yearly population estimates (``api``) and the row
+counts of the 12 x 34 CPS monthly files (``cps``), run against
+``ReplayServer``, a local HTTP server that answers from a ``ResponseCache``
+file, so they measure the client rather than the network. By default that
+file is recorded once from ``SyntheticCensus``, a stand-in for the API with
+the same endpoints, variable renames and missing vintage, and ``cps_rows``
+records in each CPS file. ``python bench.py record`` fills a recording from
+the live API (or from whatever ``CENSUS_API_URL`` points at) for
+``--recording`` to replay instead.
+
+Every stage of every scale runs in a fresh process, so the peak RSS reported
+belongs to that stage alone. Results go to ``--out`` as JSON and CSV; with
+``--baseline`` each stage's time is compared to an earlier run.
+
+    python bench.py                             # 1x, 10x, 100x history and columns
+    python bench.py -s 1x1 -s 1x10 --repeat 3   # history x columns, best of three
+    python bench.py --baseline bench/baseline.json
+    python bench.py record                      # record the live Census responses
+    python bench.py --stage api --recording bench/census.sqlite   # and replay them
+
+Months are written and read as ordinals, so a longer history runs on past
+2022 for as long as it takes. The ingest stage streams every sheet into a
+``MonthlyStore`` and reads all of it; the transform and merge stages get the
+same tables as frames whose months are ``datetime64[s]``, which, unlike the
+``[ns]`` of ``normalize_sheet``, reach well beyond the year 2262 of a 100x
+history.
+"""
+
+import abc
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+import census
+import ingest
+import instrument
+import population
+import refresh
+
+BENCH_DIR = os.path.join(ingest.CACHE_DIR, 'bench')
+RECORDING = os.path.join('bench', 'census.sqlite')
+SCALES = ('1x1', '10x1', '100x1', '1x10', '1x100')
+STAGES = ('ingest', 'transform', 'merge', 'api', 'cps')
+# the stages that replay a recording instead of reading a workbook
+REPLAYED = ('api', 'cps')
+# bump when synthetic_workbook writes something else, so cached workbooks are rewritten
+WORKBOOK_FORMAT = 2
+# likewise for synthetic_response and the recordings made from it
+RECORDING_FORMAT = 1
+CPS_ROWS = 5000  # records in a synthetic CPS monthly file, give or take 5%
+
+LAST_MONTH = pd.Period('2022-09', 'M').ordinal
+QUARTERLY_LAG = 40  # 1982 in the 2022 release
+
+# sheet -> (title, corner cell, first year, blocks); each block is the merged
+# header and its columns as (label, first year or None for the sheet's, level,
+# quarterly) where a quarterly column only has quarter-end values in the
+# quarterly year, 3 months' worth for totals (3) or the quarter's average (1);
+# a None column is a spacer
+LAYOUT = {
+    'RedMeatPoultry_Prod-Full': ('Red meat and poultry production (million pounds)', 'Type 1/', 1921, [
+        ('Commercial 2/', [('Beef 3/', None, 2300, 3), ('Veal 3/', None, 5, 3), ('Pork 3/', None, 2200, 3),
+                           ('Lamb and mutton 3/', None, 11, 3), None, ('Total red meat 3/ 4/', None, 4600, 3)]),
+        ('Federally inspected', [('Beef 3/', None, 2300, 3), ('Veal 3/', None, 4, 3),
+                                 ('Pork 3/', None, 2200, 3), ('Lamb and mutton 3/', None, 10, 3),
+                                 ('Total red meat 3/ 4/', None, 4500, 3), ('Broilers 5/', 1960, 4000, 0),
+                                 ('Other chicken 5/', 1960, 50, 0), ('Turkey 5/', 1960, 420, 0),
+                                 ('Total poultry 4/ 5/ 6/', 1960, 4500, 0),
+                                 ('Total red meat and poultry 4/', 1960, 9000, 0)]),
+    ]),
+    'SlaughterCounts-Full': ('Livestock and poultry slaughter (1,000 head)', 'Type 1/', 1907, [
+        ('Commercial 2/', [('Cattle', None, 2900, 3), ('--Steers', 1944, 1400, 3),
+                           ('--Heifers', 1944, 880, 3), None, ('--Beef cows', 1955, 320, 0),
+                           ('--Dairy cows', 1955, 270, 0), ('--Bulls and stags', 1944, 53, 3),
+                           ('Calves', None, 31, 3), ('Hogs', None, 10600, 3),
+                           ('--Barrows and gilts', 1944, 10300, 3), ('--Sows', 1944, 260, 3),
+                           ('--Boars and stags', 1944, 26, 3), ('Sheep and lambs', None, 170, 3),
+                           ('--Lambs and yearlings', 1944, 160, 3), None, ('--Mature sheep', 1944, 11, 3)]),
+        ('Federally inspected 3/', [('Cattle', None, 2800, 3), ('--Steers', 1944, 1350, 3),
+                                    ('--Heifers', 1944, 860, 3), ('--Beef cows', 1955, 310, 0),
+                                    ('--Dairy cows', 1955, 260, 0), ('--Bulls and stags', 1944, 52, 3),
+                                    ('Calves', None, 30, 3), ('Hogs', None, 10600, 3),
+                                    ('--Barrows and gilts', 1944, 10300, 3), ('--Sows', 1944, 260, 3),
+                                    ('--Boars and stags', 1944, 26, 3), ('Sheep and lambs', None, 147, 3),
+                                    ('--Lambs and yearlings', 1944, 137, 3), ('--Mature sheep', 1944, 9, 3),
+                                    ('Broilers', 1960, 807000, 0), ('Other chickens', 1960, 9000, 0),
+                                    ('Turkeys', 1960, 17000, 0)]),
+    ]),
+    'SlaughterWeights-Full': ('Livestock and poultry live and dressed weights (pounds)',
+                              'Weight and species 1/', 1921, [
+        ('Commercial average live 2/', [('Cattle', None, 1360, 1), ('Calves', None, 240, 1),
+                                        ('Hogs', None, 285, 1), None, ('Sheep and lambs', None, 125, 1)]),
+        ('Federally inspected average live', [('Cattle', None, 1368, 1), ('Calves', None, 236, 1),
+                                              ('Hogs', None, 285, 1), ('Sheep and lambs', None, 129, 1),
+                                              ('Broilers', 1960, 6.5, 0), ('Other chickens', 1960, 7, 0),
+                                              ('Turkeys', 1960, 30.5, 0)]),
+        ('Federally inspected average dressed 3/', [('Cattle', None, 830, 0), ('Steers', None, 915, 0),
+                                                    None, ('Heifers', None, 834, 0), ('Cows', None, 615, 0),
+                                                    ('Bulls and stags', None, 867, 0),
+                                                    ('Calves', None, 137, 0), ('Hogs', None, 212, 0),
+                                                    ('Sheep and lambs', None, 65, 0)]),
+    ]),
+}
+FOOTNOTES = ['1/ Excludes slaughter on farms.', '2/ Slaughter in federally inspected and other plants.',
+             'Source: USDA, National Agricultural Statistics Service, "Livestock Slaughter" and "Poultry Slaughter."',
+             'Date run: 10/26/2022 7:51:13 AM']
+
+
+def extra_names(n):
+    """Labels of the columns added to a block: 'Series aaa 3/', 'Series aab 3/', ..."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return ['Series {} 3/'.format(''.join(p)) for p in itertools.islice(itertools.product(letters, repeat=3), n)]
+
+
+def calendar(first_year, history):
+    """Month ordinals of a sheet starting in ``first_year``, ``history`` times as many, newest first.
+
+    The months past the release's last run on into the following years.
+    """
+    first = (first_year - 1970) * 12
+    return np.arange(first + (LAST_MONTH - first + 1) * history - 1, first - 1, -1)
+
+
+def month_label(month):
+    """'Jan-2022' for a month ordinal."""
+    return '{}-{}'.format(ingest.MONTH_NAMES[month % 12], month // 12 + 1970)
+
+
+def _series(rng, months, level, start, quarterly_year, quarterly):
+    """A seasonal random walk around ``level``, empty before ``start``, by quarter in ``quarterly_year``."""
+    n = len(months)
+    walk = np.exp(np.cumsum(rng.normal(0, 0.01, n))[::-1])
+    season = 1 + 0.08 * np.sin(2 * np.pi * (months % 12) / 12 + rng.uniform(0, 2 * np.pi))
+    values = level * walk * season * rng.uniform(0.97, 1.03, n)
+    values[months < start] = np.nan
+    if quarterly:
+        year = months // 12 + 1970 == quarterly_year
+        values[year & (months % 3 != 2)] = np.nan
+        values[year] *= quarterly
+    return np.round(values, 1 if level > 100 else 3)
+
+
+def synthetic_workbook(path, history=1, columns=1, seed=0):
+    """Write a workbook shaped like the USDA one, ``history`` x the months and ``columns`` x the columns."""
+    import openpyxl  # only here, like ingest, so the replayed stages start without it
+
+    rng = np.random.RandomState(seed)
+    book = openpyxl.Workbook(write_only=True)
+    book.create_sheet('Contents').append(['Livestock and Meat Domestic Data (synthetic)'])
+    for sheet_name, (title, corner, first_year, blocks) in LAYOUT.items():
+        months = calendar(first_year, history)
+        stretch = len(months) / len(calendar(first_year, 1))
+        quarterly_year = months[0] // 12 + 1970 - QUARTERLY_LAG
+        ws = book.create_sheet(sheet_name)
+
+        groups, labels, data = [corner], [None], []
+        for group, block in blocks:
+            block = block + [(name, None, rng.uniform(5, 5000), False)
+                             for name in extra_names(len(block) * (columns - 1))]
+            ws.merged_cells.add('{}2:{}2'.format(openpyxl.utils.get_column_letter(len(groups) + 1),
+                                                 openpyxl.utils.get_column_letter(len(groups) + len(block))))
+            for spec in block:
+                groups.append(group if spec is block[0] else None)
+                labels.append(spec and spec[0])
+                if spec is None:
+                    data.append(np.full(len(months), np.nan))
+                    continue
+                # a series that started later starts as far into a longer history
+                start = months[-1] if spec[1] is None else \
+                    months[0] - round((LAST_MONTH - (spec[1] - 1970) * 12) * stretch)
+                data.append(_series(rng, months, spec[2], start, quarterly_year, spec[3]))
+        data = np.column_stack(data)
+
+        ws.append([title])
+        ws.append(groups)
+        ws.append(labels)
+        year = months[0] // 12 + 1970
+        for y in (year, year - 1):
+            rows = (months // 12 + 1970 == y) & (months % 12 <= months[0] % 12)
+            totals = np.where(np.isnan(data[rows]).all(axis=0), np.nan, np.nansum(data[rows], axis=0))
+            ws.append(['Jan-{} {}'.format(ingest.MONTH_NAMES[months[0] % 12], y)]
+                      + [None if v != v else v for v in totals.tolist()])
+        for month, row in zip(months.tolist(), data.tolist()):
+            ws.append([month_label(month)] + [None if v != v else v for v in row])
+        for note in FOOTNOTES:
+            ws.append([note])
+    tmp = '{}.{}.tmp.xlsx'.format(path, os.getpid())
+    book.save(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def sheet_specs(columns=1):
+    """``ingest.SHEETS`` with the columns ``synthetic_workbook`` added to each block read."""
+    specs = {}
+    for name, spec in ingest.SHEETS.items():
+        blocks = dict(LAYOUT[spec['sheet_name']][3])
+        width = len(blocks[spec['start']]) * (columns - 1)
+        specs[name] = dict(spec, columns=spec['columns'] + [ingest.clean_name(c) for c in extra_names(width)])
+    return specs
+
+
+def workbook(history, columns, seed=0, bench_dir=BENCH_DIR):
+    """Path of the synthetic workbook for a scale, written on first use."""
+    path = os.path.join(bench_dir, 'usda-h{}-c{}-s{}-v{}.xlsx'.format(history, columns, seed, WORKBOOK_FORMAT))
+    if not os.path.exists(path):
+        os.makedirs(bench_dir, exist_ok=True)
+        synthetic_workbook(path, history, columns, seed)
+    return path
+
+
+class _CensusServer(abc.ABC):
+    """HTTP server on localhost answering Census API requests with ``respond(path)``.
+
+    ``latency`` seconds are spent on each request. Bodies are gzipped once per
+    path and at the fastest level, so the server's own work stays out of the
+    client's measurements.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._gzipped = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.base_url = 'http://127.0.0.1:{}{}'.format(
+            self.server.server_port, urllib.parse.urlsplit(census.BASE_URL).path)
+
+    @abc.abstractmethod
+    def respond(self, path):
+        """``(status, body)`` for a request path with its query."""
+
+    def _handler(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(replay.latency)
+                status, body = replay.respond(self.path)
+                gzipped = status < 300 and 'gzip' in self.headers.get('Accept-Encoding', '')
+                if gzipped:
+                    if self.path not in replay._gzipped:
+                        replay._gzipped[self.path] = gzip.compress(body, compresslevel=1)
+                    body = replay._gzipped[self.path]
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                if gzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ReplayServer(_CensusServer):
+    """Census API stand-in answering from a ``ResponseCache`` file.
+
+    Requests are looked up as if made to the host the responses were recorded
+    from; unknown ones get a 404.
+    """
+
+    def __init__(self, recording=RECORDING, latency=0.0):
+        self.cache = census.ResponseCache(recording, offline=True)
+        row = self.cache.db.execute('SELECT url FROM responses LIMIT 1').fetchone()
+        if row is None:
+            self.cache.close()
+            raise LookupError('no responses recorded in {}, run `python bench.py record` first'.format(recording))
+        parts = urllib.parse.urlsplit(row[0])
+        self.origin = '{}://{}'.format(parts.scheme, parts.netloc)
+        super().__init__(latency)
+
+    def respond(self, path):
+        try:
+            return self.cache.get(self.origin + path)
+        except census.CacheMiss:
+            return 404, b'not recorded'
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        self.cache.close()
+
+
+def _population(year, seed):
+    """Resident population of ``year``: about 1% growth a year from 249.6 million in 1990."""
+    noise = np.random.RandomState([seed, year]).uniform(-0.002, 0.002)
+    return int(249600000 * 1.0095 ** (year - 1990) * (1 + noise))
+
+
+def _variables(dataset):
+    """Variable names of a dataset as the synthetic API lists them, None for the ones it lacks.
+
+    They change where the real ones do: the CPS age from ``A_AGE`` to
+    ``PRTAGE`` in Apr-1994, the vintage estimates from ``GEONAME`` to
+    ``NAME`` in 2019 and ``POP`` to ``POP_2021`` in 2021, and there is no
+    2020 vintage.
+    """
+    parts = dataset.split('/')
+    year = int(parts[0])
+    if parts[1:3] == ['cps', 'basic']:
+        old = year < 1994 or year == 1994 and population.CPS_MONTHS.index(parts[3]) < 3
+        return ['A_AGE' if old else 'PRTAGE', 'HRMONTH', 'HRYEAR4']
+    if parts[1:] == ['pep', 'population']:
+        if year == 2020:
+            return None
+        return ['NAME' if year >= 2019 else 'GEONAME', 'POP_{}'.format(year) if year >= 2021 else 'POP', 'us']
+    return None
+
+
+def synthetic_response(path, cps_rows=CPS_ROWS, seed=0):
+    """``(status, body)`` of the synthetic Census API for a request path such as ``/data/1990/...?get=...``.
+
+    Answers the requests of ``population.population_store`` and
+    ``population.cps_counts`` with bodies shaped like the real ones; values
+    are drawn from ``seed``, the year and the month, so every recording is
+    the same.
+    """
+    parts = urllib.parse.urlsplit(path)
+    dataset = parts.path[len(urllib.parse.urlsplit(census.BASE_URL).path):].strip('/')
+    query = dict(urllib.parse.parse_qsl(parts.query))
+    names = query.get('get', '').split(',')
+    if dataset.endswith('/variables.json'):
+        variables = _variables(dataset[:-len('/variables.json')])
+        if variables is None:
+            return 404, b'error: unknown dataset'
+        return 200, json.dumps({'variables': {name: {'label': name} for name in variables}}).encode()
+
+    year = int(dataset.split('/')[0])
+    if dataset == '1990/pep/int_natrespop':
+        rows = [[str(y), str(_population(y, seed))] for y in range(1990, 2001)]
+    elif dataset == '2000/pep/int_population':
+        rows = [['United States', str(_population(1999 + d, seed)), str(d), '1'] for d in range(1, 13)]
+    elif dataset == '2012/popproj/pop':
+        rows = [['2012', str(_population(2012, seed))]]
+    elif dataset.endswith('/pep/natstprc'):
+        rows = [['United States', str(_population(year, seed)), query.get('DATE_', ''), '1']]
+    else:
+        variables = _variables(dataset)
+        if variables is None:
+            return 404, b'error: unknown dataset'
+        unknown = [name for name in names if name not in variables]
+        if unknown:
+            return 400, 'error: unknown variable \'{}\''.format(unknown[0]).encode()
+        if '/cps/basic/' in dataset:
+            rng = np.random.RandomState([seed, year, population.CPS_MONTHS.index(dataset.split('/')[-1])])
+            ages = rng.randint(0, 86, int(cps_rows * rng.uniform(0.95, 1.05)))
+            return 200, json.dumps([names] + [[str(age)] for age in ages.tolist()]).encode()
+        rows = [['United States', str(_population(year, seed)), '1']]
+    header = names + (['us'] if 'for' in query else [])
+    return 200, json.dumps([header] + rows).encode()
+
+
+class SyntheticCensus(_CensusServer):
+    """Census API stand-in answering with ``synthetic_response``."""
+
+    def __init__(self, cps_rows=CPS_ROWS, seed=0, latency=0.0):
+        self.cps_rows = cps_rows
+        self.seed = seed
+        super().__init__(latency)
+
+    def respond(self, path):
+        return synthetic_response(path, self.cps_rows, self.seed)
+
+
+def record(recording=RECORDING, base_url=census.BASE_URL, rate=50):
+    """Run both Census sweeps against ``base_url``, keeping every response in ``recording``.
+
+    The CPS files are fetched whole rather than counted as they stream by, so
+    that their bodies are there to replay. Returns the years and months
+    recorded and the vintages and months that failed.
+    """
+    cache = census.ResponseCache(recording)
+    try:
+        with census.Fetcher(max_workers=16, rate=rate, cache=cache) as client:
+            df, misses = population.yearly_population(client, base_url)
+            counts, cps_misses = population.cps_counts(client, base_url,
+                                                       count=lambda url: len(client.fetch_json(url)))
+    finally:
+        cache.close()
+    return len(df), misses, len(counts), cps_misses
+
+
+def census_recording(cps_rows=CPS_ROWS, seed=0, bench_dir=BENCH_DIR):
+    """Path of the recording of ``SyntheticCensus`` for ``cps_rows``, recorded on first use."""
+    path = os.path.join(bench_dir, 'census-r{}-s{}-v{}.sqlite'.format(cps_rows, seed, RECORDING_FORMAT))
+    if not os.path.exists(path):
+        os.makedirs(bench_dir, exist_ok=True)
+        tmp = '{}.{}.tmp.sqlite'.format(path, os.getpid())
+        with SyntheticCensus(cps_rows, seed) as server:
+            record(tmp, server.base_url, rate=None)
+        os.replace(tmp, path)
+    return path
+
+
+def sheet_frame(path, spec):
+    """The Month-indexed frame ``normalize_sheet`` gives for ``spec``, with ``datetime64[s]`` months."""
+    values = ingest.stream_table(path, **spec)[0]
+    months = pd.DatetimeIndex(values.months.astype('datetime64[M]').astype('datetime64[s]'), name='Month')
+    return pd.DataFrame(values.values, index=months, columns=list(values.types))
+
+
+def _stage(stage, path, columns, base_url, trace_memory):
+    """Run one stage in this (fresh) process and return its measurements."""
+    specs = sheet_specs(columns)
+    if stage in ('transform', 'merge'):
+        tables = {name: sheet_frame(path, spec) for name, spec in specs.items()}
+    with instrument.Recorder(trace_memory) as rec:
+        rss = instrument._max_rss_kb()
+        with rec.span(stage) as s:
+            if stage == 'ingest':
+                inputs = [ingest.stream_table(path, **spec)[0].values for spec in specs.values()]
+            elif stage == 'transform':
+                inputs = [tables['meat_prod']]
+                refresh.production({'meat_prod': tables['meat_prod']})
+            elif stage == 'merge':
+                inputs = [tables['slau_count'], tables['slau_avg_weight']]
+                refresh.slaughter({'slau_count': tables['slau_count'],
+                                   'slau_avg_weight': tables['slau_avg_weight']})
+            elif stage == 'api':
+                with census.Fetcher(max_workers=16, rate=None) as client:
+                    df, _ = population.yearly_population(client, base_url)
+                inputs = [df]
+            else:
+                with census.Fetcher(max_workers=16, rate=None) as client:
+                    counts, _ = population.cps_counts(client, base_url)
+                inputs = [pd.Series(counts, dtype='int64')]
+            s.rows_out = sum(len(t) for t in inputs)
+
+    top = rec.records[-1]
+    rows = top['rows_out']
+    cells = sum(t.size for t in inputs)
+    result = {
+        'stage': stage, 'rows': rows, 'cells': cells, 'wall_s': top['wall_s'], 'cpu_s': top['cpu_s'],
+        'rows_per_s': round(rows / top['wall_s'], 1), 'cells_per_s': round(cells / top['wall_s'], 1),
+        'peak_rss_mb': None if top['max_rss_kb'] is None else round(top['max_rss_kb'] / 1024, 1),
+        'rss_growth_mb': None if rss is None else round((top['max_rss_kb'] - rss) / 1024, 1),
+        'tracemalloc_peak_mb': None if top['tracemalloc_peak_kb'] is None else
+        round(top['tracemalloc_peak_kb'] / 1024, 1),
+        'requests': top['requests'], 'bytes': top['bytes'],
+        'spans': rec.records[:-1],
+    }
+    if stage == 'ingest':
+        result['mb_per_s'] = round(os.path.getsize(path) / 1e6 / top['wall_s'], 2)
+    return result
+
+
+def measure(stage, path=None, columns=1, base_url=None, trace_memory=False, repeat=1):
+    """Best of ``repeat`` runs of ``stage``, each in a new process."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            runs.append(pool.submit(_stage, stage, path, columns, base_url, trace_memory).result())
+    return min(runs, key=lambda r: r['wall_s'])
+
+
+def run(scales=SCALES, stages=STAGES, repeat=1, trace_memory=False, recording=None, latency=0.0,
+        cps_rows=CPS_ROWS):
+    """Measure ``stages`` at every ``'<history>x<columns>'`` scale; the Census sweeps run once.
+
+    They replay ``recording``, by default the synthetic one for ``cps_rows``.
+    """
+    results = []
+    replayed = [stage for stage in stages if stage in REPLAYED]
+    for scale in scales if len(replayed) < len(stages) else ():
+        history, columns = (int(f) for f in scale.split('x'))
+        path = workbook(history, columns)
+        for stage in stages:
+            if stage in REPLAYED:
+                continue
+            results.append(dict(measure(stage, path, columns, None, trace_memory, repeat), scale=scale))
+    if replayed:
+        try:
+            with ReplayServer(recording or census_recording(cps_rows), latency) as server:
+                for stage in replayed:
+                    results.append(dict(measure(stage, base_url=server.base_url, trace_memory=trace_memory,
+                                                repeat=repeat), scale='replay'))
+        except LookupError as e:
+            print('{}: skipped, {}'.format(', '.join(replayed), e))
+    return results
+
+
+FIELDS = ['scale', 'stage', 'rows', 'cells', 'wall_s', 'cpu_s', 'rows_per_s', 'cells_per_s', 'mb_per_s',
+          'peak_rss_mb', 'rss_growth_mb', 'tracemalloc_peak_mb', 'requests', 'bytes']
+
+
+def write(results, prefix):
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(prefix + '.json', 'w') as f:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'pandas': pd.__version__,
+                   'numpy': np.__version__, 'calamine': ingest.CalamineWorkbook is not None,
+                   'results': results}, f, indent=1)
+    with open(prefix + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    return [prefix + '.json', prefix + '.csv']
+
+
+def compare(results, baseline):
+    """``{(scale, stage): wall time / baseline wall time}`` for the pairs ``baseline`` has."""
+    with open(baseline) as f:
+        before = {(r['scale'], r['stage']): r['wall_s'] for r in json.load(f)['results']}
+    return {(r['scale'], r['stage']): r['wall_s'] / before[r['scale'], r['stage']]
+            for r in results if (r['scale'], r['stage']) in before}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('command', nargs='?', choices=['run', 'record'], default='run')
+    parser.add_argument('-s', '--scale', action='append',
+                        help='<history>x<columns> factors, repeatable (default: {})'.format(', '.join(SCALES)))
+    parser.add_argument('--stage', action='append', choices=STAGES, help='stage to run, repeatable (default: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per measurement, the fastest is kept')
+    parser.add_argument('--trace-memory', action='store_true', help='also report the tracemalloc peak (slower)')
+    parser.add_argument('--recording',
+                        help='Census responses to replay, or to record into (default: synthetic ones to replay, '
+                             '{} to record)'.format(RECORDING))
+    parser.add_argument('--cps-rows', type=int, default=CPS_ROWS,
+                        help='records in each synthetic CPS file (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the replayed API spends per request')
+    parser.add_argument('-o', '--out', default=os.path.join('bench', 'latest'), help='report prefix')
+    parser.add_argument('--baseline', help='earlier report (.json) to compare wall times against')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        recording = args.recording or RECORDING
+        years, misses, months, cps_misses = record(recording)
+        print('recorded {} years and {} CPS months into {}, {} vintages and {} months failed'.format(
+            years, months, recording, len(misses), len(cps_misses)))
+        return 0
+
+    results = run(args.scale or SCALES, args.stage or STAGES, args.repeat, args.trace_memory,
+                  args.recording, args.latency, args.cps_rows)
+    ratios = compare(results, args.baseline) if args.baseline else {}
+    for r in results:
+        line = '{scale:>7} {stage:<9} {rows:>8} rows {wall_s:>8.3f} s {rows_per_s:>10,.0f} rows/s ' \
+               '{cells_per_s:>12,.0f} cells/s {peak_rss_mb:>7} MB peak'.format(**r)
+        if (r['scale'], r['stage']) in ratios:
+            line += '  x{:.2f} of baseline'.format(ratios[r['scale'], r['stage']])
+        print(line)
+    print('report: {}'.format(', '.join(write(results, args.out))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,442 @@
+"""Client for the Census Data API (https://www.census.gov/data/developers/about.html).
+
+The population sections issue hundreds of small GET requests (12 CPS months x
+34 years plus the estimate vintages). ``Fetcher`` runs them on a thread pool
+with a concurrency cap, spaces them with a shared token bucket instead of a
+fixed sleep after each call, keeps one keep-alive connection per host and
+thread, and retries connection errors, 429s and 5xx responses with
+exponential backoff.
+
+Most endpoints hold published estimates that never change, so ``Fetcher`` can
+also sit on a ``ResponseCache``: a SQLite file of response bodies keyed by the
+URL without its ``key=`` parameter, with per-endpoint TTLs and LRU eviction.
+Setting ``CENSUS_OFFLINE=1`` makes every cache miss fail at once instead of
+touching the network, so the analysis reproduces on air-gapped machines.
+
+Variable names drift between years (``A_AGE`` became ``PRTAGE`` in the CPS,
+``GEONAME`` became ``NAME`` in the vintage estimates). ``SchemaResolver`` reads
+each dataset's ``variables.json`` once and picks the names that exist before
+the data request is made, raising ``VariableNotFound`` when none do.
+"""
+
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+
+import numpy as np
+
+# point at a local stand-in server to run the sweeps offline
+BASE_URL = os.environ.get('CENSUS_API_URL', 'https://api.census.gov/data')
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+MAX_REDIRECTS = 5
+
+QUOTE, BACKSLASH = ord('"'), ord('\\')
+OPENERS, CLOSERS = b'[{', b']}'
+
+CACHE_PATH = os.path.join('data', '.cache', 'census.sqlite')
+OFFLINE = os.environ.get('CENSUS_OFFLINE', '') not in ('', '0')
+DAY = 24 * 3600
+
+# seconds a cached response stays fresh, first matching pattern wins; None keeps it forever.
+# Intercensal series, projections, closed vintages and CPS microdata are never revised, but the
+# variable lists of the same datasets are, so they come first.
+TTLS = [
+    (r'/variables\.json(\?|$)', 30 * DAY),
+    (r'/pep/int_', None),
+    (r'/popproj/', None),
+    (r'/pep/(natstprc|population)\b', None),
+    (r'/cps/basic/', None),
+]
+DEFAULT_TTL = DAY
+# error responses expire on their own clock: a 404 for a month not published yet must not outlive the
+# endpoint's TTL, which is forever for the closed series above
+ERROR_TTL = 6 * 3600
+# answers about the API key rather than the URL; the cache key leaves the key out, so they are not stored
+AUTH_STATUS = (401, 403)
+
+# what one request can still fail with once its retries are spent: an offline cache miss or a variable
+# no candidate resolves to (LookupError), an HTTP error status, a refused or timed out connection
+# (OSError), a broken response (HTTPException) or a body that does not parse (ValueError, LookupError);
+# sweeps over many datasets record these per dataset and go on
+FETCH_ERRORS = (LookupError, OSError, ValueError, http.client.HTTPException)
+
+# process-wide counters of network requests, bytes received and cache hits, read by instrument.py
+STATS = {'requests': 0, 'bytes': 0, 'cache_hits': 0}
+_stats_lock = threading.Lock()
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode for a URL that is not in the cache."""
+
+
+class VariableNotFound(LookupError):
+    """None of the candidate variables exist in a dataset."""
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, delta in deltas.items():
+            STATS[name] += delta
+
+
+class _CountingReader:
+    """Read-through wrapper adding the bytes read to ``STATS``."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        _count(bytes=len(data))
+        return data
+
+
+def cache_key(url):
+    """Hash of ``url`` without the API key, so cached responses are shared between keys."""
+    parts = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if k != 'key']
+    stripped = urllib.parse.urlunsplit(parts._replace(scheme='', query=urllib.parse.urlencode(sorted(query))))
+    return hashlib.sha256(stripped.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite store of Census responses with per-endpoint TTLs and size-bounded LRU eviction.
+
+    Error responses are stored too, for ``error_ttl`` seconds whatever the
+    endpoint, so a variable that does not exist for a year is not asked for
+    again within a run or a rerun, yet a month published since gets fetched.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=1 << 30, ttls=TTLS, default_ttl=DEFAULT_TTL,
+                 offline=OFFLINE, error_ttl=ERROR_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.default_ttl = default_ttl
+        self.error_ttl = error_ttl
+        self.offline = offline
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, '
+                        'status INTEGER, body BLOB, size INTEGER, stored REAL, accessed REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.db.commit()
+
+    def ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url):
+        """Return ``(status, body)`` for a fresh entry, or ``None``.
+
+        Offline, stale entries are still served and a miss raises ``CacheMiss``.
+        """
+        key = cache_key(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT status, body, stored FROM responses WHERE key = ?',
+                                  (key,)).fetchone()
+            if row is not None:
+                self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                self.db.commit()
+        if row is not None:
+            status, body, stored = row
+            ttl = self.error_ttl if status >= 400 else self.ttl(url)
+            if self.offline or ttl is None or now - stored <= ttl:
+                return status, bytes(body)
+        if self.offline:
+            raise CacheMiss('{} is not cached and CENSUS_OFFLINE is set'.format(url))
+        return None
+
+    def put(self, url, status, body):
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (cache_key(url), url.split('?')[0], status, body, len(body), now, now))
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(total - self.max_bytes)
+            self.db.commit()
+
+    def _evict(self, excess):
+        """Drop the least recently used entries until ``excess`` bytes are freed."""
+        freed = 0
+        doomed = []
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        self.db.executemany('DELETE FROM responses WHERE key = ?', doomed)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class TokenBucket:
+    """Hand out ``rate`` tokens per second, with bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """Concurrent, rate-limited GET client.
+
+    ``max_workers`` caps the requests in flight, ``rate`` is the sustained
+    requests per second (``None`` for no limit) and ``retries`` the number of
+    extra attempts for transient failures, spaced ``backoff * 2 ** attempt``
+    seconds apart. 4xx responses other than 429 raise ``HTTPError`` at once.
+    Responses found in ``cache`` skip both the rate limit and the network.
+    """
+
+    def __init__(self, max_workers=8, rate=10, burst=None, retries=3, backoff=0.5, timeout=60,
+                 cache=None):
+        self.max_workers = max_workers
+        self.cache = cache
+        self.bucket = TokenBucket(rate, burst or max_workers) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _connection(self, scheme, netloc):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = self._local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _request(self, url, consume=None):
+        """Send one GET for ``url`` and return ``(status, headers, body)``, following redirects.
+
+        With ``consume``, a successful response body is not read into memory:
+        ``consume`` gets the decompressed stream and its result is returned in
+        place of the body.
+        """
+        for _ in range(MAX_REDIRECTS):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path + ('?' + parts.query if parts.query else '')
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = conn.getresponse()
+                _count(requests=1)
+                gzipped = response.getheader('Content-Encoding') == 'gzip'
+                if consume is not None and response.status < 300:
+                    stream = _CountingReader(response)
+                    body = consume(gzip.GzipFile(fileobj=stream) if gzipped else stream)
+                    # drain what consume left so the connection can be reused
+                    stream.read()
+                else:
+                    body = response.read()
+                    _count(bytes=len(body))
+                    if gzipped:
+                        body = gzip.decompress(body)
+            except (OSError, http.client.HTTPException):
+                # the server may have closed the keep-alive connection in between
+                self._drop_connection(parts.scheme, parts.netloc)
+                raise
+            if response.getheader('Connection', '').lower() == 'close':
+                self._drop_connection(parts.scheme, parts.netloc)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            return response.status, response.headers, body
+        raise HTTPError(url, 310, 'Too many redirects', None, None)
+
+    def _get(self, url, cache_url, consume=None):
+        if self.cache is not None:
+            hit = self.cache.get(cache_url)
+            if hit is not None:
+                _count(cache_hits=1)
+                status, body = hit
+                if status >= 400:
+                    raise HTTPError(url, status, body[:200].decode('utf-8', 'replace'), None, None)
+                return body
+
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            last = attempt == self.retries
+            try:
+                status, headers, body = self._request(url, consume)
+            except (OSError, http.client.HTTPException):
+                if last:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if status < 400:
+                if consume is not None:
+                    body = str(body).encode()
+                if self.cache is not None:
+                    self.cache.put(cache_url, status, body)
+                return body
+            if status not in RETRY_STATUS or last:
+                if self.cache is not None and status not in RETRY_STATUS + AUTH_STATUS:
+                    self.cache.put(cache_url, status, body)
+                raise HTTPError(url, status, body[:200].decode('utf-8', 'replace'), headers, None)
+            delay = headers.get('Retry-After')
+            time.sleep(float(delay) if delay and delay.isdigit() else self.backoff * 2 ** attempt)
+
+    def fetch(self, url):
+        """Return the body of ``url``."""
+        return self._get(url, url)
+
+    def count_rows(self, url):
+        """``len(json.loads(body))`` for ``url`` without holding the body; only the count is cached."""
+        return int(self._get(url, url + '#rows', consume=count_rows))
+
+    def fetch_json(self, url):
+        return json.loads(self.fetch(url))
+
+    def map(self, fn, items):
+        """``[fn(item) for item in items]`` with up to ``max_workers`` calls in flight."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.max_workers)
+        return list(self._pool.map(fn, items))
+
+
+def count_rows(stream, chunk_size=1 << 20):
+    """Count the rows of a JSON array of arrays read from ``stream``.
+
+    The CPS microdata endpoints have no aggregate query form, so the body is
+    scanned in fixed-size chunks: brackets outside strings are tracked with
+    NumPy and every array opened at depth one is a row (the header row
+    included, like ``len(json.loads(...))``). Memory stays at one chunk.
+    """
+    rows = 0
+    depth = 0
+    in_string = False
+    escaped = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return rows
+        buf = np.frombuffer(chunk, dtype=np.uint8)
+        if escaped or BACKSLASH in chunk:
+            # escaped quotes are rare in Census rows, walk those chunks byte by byte
+            for c in chunk:
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif c == BACKSLASH:
+                        escaped = True
+                    elif c == QUOTE:
+                        in_string = False
+                elif c == QUOTE:
+                    in_string = True
+                elif c in OPENERS:
+                    depth += 1
+                    rows += depth == 2
+                elif c in CLOSERS:
+                    depth -= 1
+            continue
+
+        quotes = buf == QUOTE
+        outside = (np.cumsum(quotes) + in_string) % 2 == 0
+        opens = ((buf == OPENERS[0]) | (buf == OPENERS[1])) & outside
+        closes = ((buf == CLOSERS[0]) | (buf == CLOSERS[1])) & outside
+        levels = depth + np.cumsum(opens.astype(np.int64) - closes)
+        rows += int(np.count_nonzero(opens & (levels == 2)))
+        depth = int(levels[-1])
+        in_string = not bool(outside[-1])
+
+
+class SchemaResolver:
+    """Choose variable names from the ``variables.json`` of each dataset.
+
+    ``dataset`` is the path below the base URL, e.g. ``'1994/cps/basic/apr'``.
+    Each dataset's variable list is fetched once (through ``fetcher`` and so its
+    cache) and kept for the life of the resolver.
+    """
+
+    def __init__(self, fetcher, base_url=BASE_URL):
+        self.fetcher = fetcher
+        self.base_url = base_url
+        self._variables = {}
+        self._lock = threading.Lock()
+
+    def variables(self, dataset):
+        with self._lock:
+            if dataset in self._variables:
+                return self._variables[dataset]
+        url = '{}/{}/variables.json'.format(self.base_url, dataset)
+        names = frozenset(self.fetcher.fetch_json(url)['variables'])
+        with self._lock:
+            self._variables[dataset] = names
+        return names
+
+    def resolve(self, dataset, *choices):
+        """Return the first of ``choices`` available in ``dataset``.
+
+        A choice is a variable name or a tuple of names that must all exist.
+        """
+        available = self.variables(dataset)
+        for choice in choices:
+            names = (choice,) if isinstance(choice, str) else choice
+            if all(name in available for name in names):
+                return choice
+        raise VariableNotFound('{} has none of {}'.format(
+            dataset, ', '.join(c if isinstance(c, str) else ','.join(c) for c in choices)))
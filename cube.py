@@ -0,0 +1,243 @@
+"""Materialized quarterly, yearly and rolling aggregates of the monthly series.
+
+``AggregateCube`` keeps, for every metric (meat production, slaughter counts,
+average and total live weights) and type, the running sum of its monthly
+values and the running count of months that have one. The total over any run
+of months is the difference of two rows of those, so the periods of every
+granularity in ``FREQS`` come out of the one cumulative pass and are stored
+as arrays. New or revised months only redo the running sums from the first
+changed month on, and the aggregates of the periods from there.
+
+Figures like the Readme's growth since 1990 are then read off the stored
+yearly totals by ``growth`` instead of regrouping the monthly frames:
+
+    python cube.py [1990]       # growth of every series since 1990, up to the last full year
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import refresh
+import store
+
+# months per period; R12 is the sum of the 12 months up to each month
+FREQS = {'Q': 3, 'Y': 12, 'R12': 12}
+CUBE_PATH = os.path.join(refresh.STATE_DIR, 'cube.npz')
+
+
+def metrics(meat_prod, slau_count, slau_weight2):
+    """The stores the cube aggregates, from the frames of the production and slaughter pipelines.
+
+    Production is in million pounds, counts in thousand head and weights in
+    pounds of live weight.
+    """
+    return {
+        'production': store.MonthlyStore.from_frame(meat_prod),
+        'slaughter_count': store.MonthlyStore.from_frame(slau_count),
+        'average_weight': store.MonthlyStore.from_long(slau_weight2, 'average_weight'),
+        'total_weight': store.MonthlyStore.from_long(slau_weight2, 'weight'),
+    }
+
+
+def _bounds(freq, start, n, periods):
+    """First and past-the-last row of each period of ``freq``, for rows ``start``..``start + n``."""
+    size = FREQS[freq]
+    if freq == 'R12':
+        hi = periods - start + 1
+        return np.maximum(hi - size, 0), hi
+    return np.clip(periods * size - start, 0, n), np.clip((periods + 1) * size - start, 0, n)
+
+
+class AggregateCube:
+    """Sums and month counts of every metric by granularity, period and type.
+
+    ``series`` holds per metric the first month ordinal ``start``, the
+    ``types``, the monthly ``values`` on a calendar without holes and the
+    running ``sums`` and ``counts`` (one row longer, starting at zero).
+    ``aggregates`` maps ``(metric, freq)`` to the period ordinals and their
+    sums and counts, a column per type.
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.aggregates = {}
+
+    def __repr__(self):
+        return '<AggregateCube: {}>'.format(', '.join(
+            '{} ({} months, {} types)'.format(m, len(s['values']), len(s['types'])) for m, s in self.series.items())
+            or 'empty')
+
+    def update(self, metric, values):
+        """Bring ``metric`` in line with the ``MonthlyStore`` ``values``.
+
+        Returns the first month ordinal whose aggregates were recomputed, or
+        None when nothing changed.
+        """
+        start = int(values.months[0]) if len(values) else 0
+        dense = np.full((int(values.months[-1]) - start + 1 if len(values) else 0, len(values.types)), np.nan)
+        dense[values.months - start] = values.values
+
+        old = self.series.get(metric)
+        first = 0
+        if old is not None and old['types'].equals(values.types) and old['start'] == start:
+            n = min(len(old['values']), len(dense))
+            same = (old['values'][:n] == dense[:n]) | (np.isnan(old['values'][:n]) & np.isnan(dense[:n]))
+            differs = np.flatnonzero(~same.all(axis=1))
+            first = int(differs[0]) if len(differs) else n
+            if first == len(dense) == len(old['values']):
+                return None
+
+        sums = np.zeros((len(dense) + 1, dense.shape[1]))
+        counts = np.zeros(sums.shape, dtype=np.int64)
+        if first:
+            sums[:first + 1], counts[:first + 1] = old['sums'][:first + 1], old['counts'][:first + 1]
+        valid = ~np.isnan(dense[first:])
+        np.cumsum(np.where(valid, dense[first:], 0), axis=0, out=sums[first + 1:])
+        np.cumsum(valid, axis=0, out=counts[first + 1:])
+        sums[first + 1:] += sums[first]
+        counts[first + 1:] += counts[first]
+        self.series[metric] = {'start': start, 'types': pd.Index(values.types), 'values': dense,
+                               'sums': sums, 'counts': counts}
+
+        for freq, size in FREQS.items():
+            step = 1 if freq == 'R12' else size
+            periods = np.arange(start // step, (start + len(dense) - 1) // step + 1) if len(dense) \
+                else np.empty(0, dtype=np.int64)
+            lo, hi = _bounds(freq, start, len(dense), periods)
+            # periods ending before the first changed month keep their totals; compared on the calendar end,
+            # as a period cut short by a shorter store ends at the last row but still changed
+            ends = periods - start + 1 if freq == 'R12' else (periods + 1) * size - start
+            kept = int(np.searchsorted(ends, first, side='right')) if first else 0
+            new_sums = sums[hi[kept:]] - sums[lo[kept:]]
+            new_counts = counts[hi[kept:]] - counts[lo[kept:]]
+            if kept:
+                _, old_sums, old_counts = self.aggregates[metric, freq]
+                new_sums = np.concatenate([old_sums[:kept], new_sums])
+                new_counts = np.concatenate([old_counts[:kept], new_counts])
+            self.aggregates[metric, freq] = (periods, new_sums, new_counts)
+        return start + first
+
+    def table(self, metric, freq='Y'):
+        """Long frame of one granularity: the period, ``Types``, ``sum``, ``months`` and ``mean``.
+
+        The period is an integer ``Year``, a ``Quarter`` period or, for the
+        rolling sums, the ``Month`` each 12-month window ends on. Rows run by
+        period, then type, as ``transform.yearly_totals`` gives them.
+        """
+        periods, sums, counts = self.aggregates[metric, freq]
+        types = self.series[metric]['types']
+        order = np.argsort(np.asarray(types, dtype=object), kind='stable')
+        if freq == 'Y':
+            period = ('Year', periods + 1970)
+        elif freq == 'Q':
+            period = ('Quarter', pd.PeriodIndex(pd.arrays.PeriodArray(periods, dtype=pd.PeriodDtype('Q'))))
+        else:
+            period = ('Month', pd.PeriodIndex(pd.arrays.PeriodArray(periods, dtype=store.MONTH_DTYPE)).to_timestamp())
+        df = pd.DataFrame({
+            period[0]: np.repeat(np.asarray(period[1]), len(types)),
+            'Types': np.tile(np.asarray(types, dtype=object)[order], len(periods)),
+            'sum': sums[:, order].ravel(),
+            'months': counts[:, order].ravel(),
+        })
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['mean'] = df['sum'] / df['months']
+        return df
+
+    def last_full_year(self, metric):
+        """The latest year in which every type of ``metric`` reported either all twelve months or none."""
+        periods, _, counts = self.aggregates[metric, 'Y']
+        full = ((counts == 12) | (counts == 0)).all(axis=1) & (counts > 0).any(axis=1)
+        return int(periods[full][-1]) + 1970 if full.any() else None
+
+    def growth(self, metric, since=1990, until=None):
+        """Change of every type's yearly total from ``since`` to ``until`` (default: the last full year).
+
+        Returns a Series by type: 1.42 is 142% more. Types without a total in
+        either year are NaN.
+        """
+        periods, sums, counts = self.aggregates[metric, 'Y']
+        until = self.last_full_year(metric) if until is None else until
+        rows = np.array([since, -1 if until is None else until]) - 1970 - periods[0]
+        if (rows < 0).any() or (rows >= len(periods)).any():
+            raise KeyError('{} has no yearly totals for {} and {}'.format(metric, since, until))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            change = np.where((counts[rows] > 0).all(axis=0), sums[rows[1]] / sums[rows[0]] - 1, np.nan)
+        return pd.Series(change, index=self.series[metric]['types'], name='{}-{}'.format(since, until))
+
+    def growth_table(self, since=1990):
+        """``growth`` of every metric and type since ``since``, as a Metric/Types/since/until/growth frame."""
+        frames = []
+        for metric in self.series:
+            change = self.growth(metric, since)
+            frames.append(pd.DataFrame({'Metric': metric, 'Types': change.index, 'since': since,
+                                        'until': self.last_full_year(metric), 'growth': change.to_numpy()}))
+        return pd.concat(frames, ignore_index=True)
+
+    def save(self, path=CUBE_PATH):
+        arrays, meta = {}, {}
+        for metric, series in self.series.items():
+            meta[metric] = {'start': series['start'], 'types': [str(t) for t in series['types']]}
+            for field in ('values', 'sums', 'counts'):
+                arrays['{}.{}'.format(metric, field)] = series[field]
+            for freq in FREQS:
+                for field, array in zip(('periods', 'sums', 'counts'), self.aggregates[metric, freq]):
+                    arrays['{}.{}.{}'.format(metric, freq, field)] = array
+        arrays['meta'] = np.array(json.dumps(meta))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = '{}.{}.tmp.npz'.format(path, os.getpid())
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=CUBE_PATH):
+        """The cube saved at ``path``, or an empty one when there is none to read."""
+        cube = cls()
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = dict(npz.items())
+            meta = json.loads(str(arrays['meta']))
+            for metric, info in meta.items():
+                cube.series[metric] = {'start': info['start'], 'types': pd.Index(info['types'], dtype=object)}
+                for field in ('values', 'sums', 'counts'):
+                    cube.series[metric][field] = arrays['{}.{}'.format(metric, field)]
+                for freq in FREQS:
+                    cube.aggregates[metric, freq] = tuple(arrays['{}.{}.{}'.format(metric, freq, field)]
+                                                          for field in ('periods', 'sums', 'counts'))
+        except (OSError, ValueError, KeyError):
+            return cls()
+        return cube
+
+
+def refresh_cube(meat_prod, slau_count, slau_weight2, path=CUBE_PATH):
+    """Update the cube saved at ``path`` from the pipeline frames; return it and ``{metric: first month changed}``."""
+    cube = AggregateCube.load(path)
+    changed = {}
+    for metric, values in metrics(meat_prod, slau_count, slau_weight2).items():
+        first = cube.update(metric, values)
+        if first is not None:
+            changed[metric] = first
+    if changed:
+        cube.save(path)
+    return cube, changed
+
+
+def main(since=1990, workbook=refresh.WORKBOOK):
+    outputs = {}
+    for name, (tables, prepare) in refresh.PIPELINES.items():
+        outputs.update(refresh.refresh(name, {t: ingest.load_table(workbook, t) for t in tables}, prepare)[0])
+    cube, changed = refresh_cube(outputs['meat_prod'], outputs['slau_count'], outputs['slau_weight2'])
+    for metric, first in changed.items():
+        print('{}: recomputed from {}'.format(metric, pd.Period(ordinal=first, freq='M').strftime('%b-%Y')))
+    table = cube.growth_table(int(since))
+    table['growth'] = table['growth'].map('{:+.0%}'.format)
+    print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,537 @@
+"""Workbook ingestion for the USDA Livestock and Meat Domestic Data.
+
+Parsing the human-formatted sheets through openpyxl is by far the slowest step
+of the analysis, so every parsed frame is written once to a columnar ``.npz``
+cache under ``data/.cache`` and loaded from there on later runs. Cache entries
+are keyed on the workbook content hash and on ``code_version``, a hash of the
+parsing code; size and mtime are only used to skip re-hashing an untouched
+file, so a new USDA release or a parser change rebuilds the cache by itself.
+
+The sheets are laid out for humans: a merged first-level header (Commercial vs.
+Federally inspected), the secondary categories one row below with footnote
+marks, and footnote rows after the data. ``SHEETS`` describes the block each
+table of the analysis comes from and ``load_table`` turns it into a tidy frame,
+streaming only the rows and columns of that block (through calamine when it is
+installed, openpyxl's read-only mode otherwise) instead of building every cell
+with ``pd.read_excel``. ``INGEST_READER=pandas`` switches back to the latter.
+The rows are filtered and converted to floats ``BATCH_ROWS`` at a time, and
+``stream_table`` can fill gaps on the way into a ``MonthlyStore``, so much
+longer or wider series of the same layout load in bounded memory.
+
+Every USDA release can be kept under ``data/releases``; ``load_releases`` parses
+all (workbook, table) pairs across a process pool into the same cache and
+stacks them with a ``Vintage`` column:
+
+    python ingest.py [data/releases]
+"""
+
+import functools
+import glob
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import store
+import transform
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional, the streaming reader falls back to openpyxl's read-only mode
+    CalamineWorkbook = None
+
+CACHE_DIR = os.path.join('data', '.cache')
+MANIFEST = 'manifest.json'
+# 'stream' reads only the cells a table needs (through calamine when installed),
+# 'pandas' parses the whole sheet with pd.read_excel
+READER = os.environ.get('INGEST_READER', 'stream')
+# one workbook per USDA release, kept for vintage comparisons
+RELEASE_DIR = os.path.join('data', 'releases')
+# 'meat_statistics_2022-10.xlsx', 'LDM_202210.xlsx'
+RELEASE_DATE = r'(?<!\d)((?:19|20)\d{2})[-_]?(0[1-9]|1[0-2])(?!\d)'
+
+# rows parsed at a time by the streaming reader
+BATCH_ROWS = 4096
+
+# rows holding footnotes and the source line rather than data
+FOOTNOTE = r'/ |Source|Date run'
+# monthly rows, e.g. 'Jan-2022' (the yearly and 'Jan-Sep 2022' rows are left out)
+MONTH = r'\w{3}-\d{4}'
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+# ``start``/``end`` are the merged header cells bounding the block (``end`` excluded),
+# ``columns`` the cleaned secondary headers to keep
+SHEETS = {
+    # Federally inspected has more meat types than Commercial, the numbers are pretty close
+    'meat_prod': {
+        'sheet_name': 'RedMeatPoultry_Prod-Full',
+        'start': 'Federally inspected',
+        'columns': ['beef', 'veal', 'pork', 'lamb_and_mutton', 'broilers', 'turkey'],
+    },
+    'slau_count': {
+        'sheet_name': 'SlaughterCounts-Full',
+        'start': 'Federally inspected 3/',
+        'columns': ['cattle', 'heifers', 'beef_cows', 'calves', 'hogs', 'sheep_and_lambs',
+                    'broilers', 'turkeys'],
+    },
+    # average live weight, the dressed block has no broilers
+    'slau_avg_weight': {
+        'sheet_name': 'SlaughterWeights-Full',
+        'start': 'Federally inspected average live',
+        'end': 'Federally inspected average dressed 3/',
+        'columns': ['cattle', 'calves', 'hogs', 'sheep_and_lambs', 'broilers', 'turkeys'],
+    },
+}
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of the source of the parsing code: this module and the ``transform`` and ``store`` it builds on.
+
+    It is part of every ``normalize_sheet`` cache name, so tables parsed by
+    older code are not served once the parser changes.
+    """
+    digest = hashlib.sha256()
+    for module in (sys.modules[__name__], transform, store):
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()[:16]
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def workbook_fingerprint(path, cache_dir=CACHE_DIR):
+    """Return the content hash of ``path``, re-hashing only when size or mtime moved."""
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    manifest = _read_manifest(cache_dir)
+    entry = manifest.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha256']
+
+    digest = file_hash(path)
+    if entry and entry['sha256'] != digest:
+        # a new release replaced the workbook, drop the frames parsed from the old one
+        stale = entry['sha256'][:16] + '-'
+        for name in os.listdir(cache_dir):
+            if name.startswith(stale):
+                os.remove(os.path.join(cache_dir, name))
+    manifest[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+    _write_manifest(cache_dir, manifest)
+    return digest
+
+
+def _encode_column(values, prefix, arrays):
+    """Store one column under ``prefix`` in ``arrays`` and return its kind."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        arrays[prefix + 'codes'] = values.cat.codes.to_numpy()
+        arrays[prefix + 'categories'] = values.cat.categories.to_numpy().astype(str)
+        return 'category'
+    if isinstance(values.dtype, pd.PeriodDtype):
+        arrays[prefix] = values.array.asi8
+        return str(values.dtype)
+    if values.dtype.kind in 'biufM':
+        arrays[prefix] = values.to_numpy()
+        return 'array'
+
+    cells = values.to_numpy(dtype=object)
+    if pd.api.types.infer_dtype(cells, skipna=False) in ('string', 'empty'):
+        # type labels repeat on every row of a long frame, store each one once
+        codes, uniques = pd.factorize(cells)
+        arrays[prefix + 'codes'] = codes.astype(np.int32)
+        arrays[prefix + 'uniques'] = np.asarray(uniques, dtype=str)
+        return 'str'
+    raise TypeError('cannot cache {} cells in column {!r}'.format(
+        pd.api.types.infer_dtype(cells, skipna=False), prefix))
+
+
+def _decode_column(kind, prefix, arrays):
+    if kind == 'category':
+        return pd.Categorical.from_codes(arrays[prefix + 'codes'], arrays[prefix + 'categories'])
+    if kind == 'array':
+        return arrays[prefix]
+    if kind == 'str':
+        return arrays[prefix + 'uniques'].astype(object)[arrays[prefix + 'codes']]
+    if kind.startswith('period['):
+        return pd.arrays.PeriodArray(arrays[prefix], dtype=pd.api.types.pandas_dtype(kind))
+
+    raise ValueError('unknown column kind {!r}'.format(kind))
+
+
+def save_frame(path, df):
+    """Write ``df`` as one typed array per column into an ``.npz`` file."""
+    arrays = {}
+    kinds = []
+    for i in range(df.shape[1]):
+        kinds.append(_encode_column(df.iloc[:, i], 'c{}_'.format(i), arrays))
+    index_kind = _encode_column(df.index.to_series(), 'index_', arrays)
+    meta = {'columns': [str(c) for c in df.columns], 'kinds': kinds,
+            'index_kind': index_kind, 'index_name': df.index.name,
+            'range_index': isinstance(df.index, pd.RangeIndex) and df.index.step == 1
+                           and df.index.start == 0}
+    arrays['meta'] = np.array(json.dumps(meta))
+    # per process, parallel loads of the same release may write the same entry
+    tmp = '{}.{}.tmp.npz'.format(path, os.getpid())
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load_frame(path):
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = dict(npz.items())
+    meta = json.loads(str(arrays['meta']))
+    data = {}
+    for i, kind in enumerate(meta['kinds']):
+        data[i] = _decode_column(kind, 'c{}_'.format(i), arrays)
+    if meta['range_index']:
+        index = pd.RangeIndex(len(arrays['index_']))
+    else:
+        index = pd.Index(_decode_column(meta['index_kind'], 'index_', arrays), name=meta['index_name'])
+    df = pd.DataFrame(data, index=index)
+    df.columns = meta['columns']
+    return df
+
+
+def cache_path(workbook, name, cache_dir=CACHE_DIR):
+    """Where the frame cached under ``name`` for the current content of ``workbook`` lives."""
+    digest = workbook_fingerprint(workbook, cache_dir)
+    return os.path.join(cache_dir, '{}-{}.npz'.format(digest[:16], name))
+
+
+def cached_frame(workbook, name, build, cache_dir=CACHE_DIR):
+    """Return ``build()`` for ``workbook``, reusing the copy cached under ``name``."""
+    path = cache_path(workbook, name, cache_dir)
+    if os.path.exists(path):
+        try:
+            return load_frame(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # unreadable cache entry, rebuild it below
+    df = build()
+    save_frame(path, df)
+    return df
+
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+
+
+def clean_name(label):
+    """'Lamb and mutton 3/' -> 'lamb_and_mutton', '--Heifers' -> 'heifers'."""
+    return re.search(r'[A-Za-z]\D*', label).group().strip().replace(' ', '_').lower()
+
+
+def stream_rows(workbook, sheet_name, min_row=0, max_row=None, max_col=None):
+    """Yield the cell values of rows ``min_row``..``max_row`` and columns 0..``max_col`` (0-based, inclusive).
+
+    Empty cells are None. Goes through calamine when it is installed and
+    through openpyxl's read-only mode otherwise; both hand out one row at a
+    time rather than building every cell of the sheet.
+    """
+    stop_row = None if max_row is None else max_row + 1
+    stop_col = None if max_col is None else max_col + 1
+    if CalamineWorkbook is not None:
+        rows = CalamineWorkbook.from_path(workbook).get_sheet_by_name(sheet_name).iter_rows()
+        for row in itertools.islice(rows, min_row, stop_row):
+            yield tuple(None if v == '' else v for v in row[:stop_col])
+        return
+
+    import openpyxl  # only here, so importing ingest for cached tables stays cheap
+
+    book = openpyxl.load_workbook(workbook, read_only=True, data_only=True)
+    try:
+        yield from book[sheet_name].iter_rows(min_row=min_row + 1, max_row=stop_row, max_col=stop_col,
+                                              values_only=True)
+    finally:
+        book.close()
+
+
+def _block_positions(sheet_name, groups, labels, start, columns, end=None):
+    first = groups.index(start)
+    # the last block runs to the end of the labels; writers that trim empty
+    # cells leave the merged header row shorter than that
+    last = groups.index(end) if end is not None else len(labels)
+
+    found = {}
+    for pos in range(first, last):
+        if isinstance(labels[pos], str):
+            found.setdefault(clean_name(labels[pos]), pos)
+    missing = [c for c in columns if c not in found]
+    if missing:
+        raise KeyError('{} has no {} columns under {!r}'.format(sheet_name, missing, start))
+    return [found[c] for c in columns]
+
+
+def locate_columns(workbook, sheet_name, start, columns, end=None, header=1):
+    """Return the sheet positions of ``columns`` inside the ``start``..``end`` header block."""
+    head = pd.read_excel(workbook, sheet_name=sheet_name, header=None, nrows=header + 2)
+    return _block_positions(sheet_name, head.iloc[header].tolist(), head.iloc[header + 1].tolist(),
+                            start, columns, end)
+
+
+def coerce_cells(labels, cells, columns, dtype='float64'):
+    """Convert ``cells``, a row per label and a column per name in ``columns``; return ``(values, unparsed)``.
+
+    Numbers, numeric text such as '1,234.5' and empty cells convert as they
+    are. Anything else, like the '(NA)' and '(D)' marks of USDA tables or a
+    stray date, becomes NaN and is listed in ``unparsed``: a frame with the
+    row label (``Month``), the ``Column`` and the cell as text (``Value``).
+    """
+    try:
+        return np.array(cells, dtype=dtype).reshape(-1, len(columns)), _unparsed([])
+    except (TypeError, ValueError):
+        pass  # text or dates among the numbers, convert column by column below
+    cells = np.array(cells, dtype=object).reshape(-1, len(columns))
+    values = np.empty(cells.shape, dtype=dtype)
+    failed = []
+    for i, column in enumerate(columns):
+        text = pd.Series(cells[:, i]).map(lambda v: v.replace(',', '').strip() or None if isinstance(v, str) else v)
+        numbers = pd.to_numeric(text, errors='coerce')
+        values[:, i] = numbers
+        failed.extend((labels[r], column, str(cells[r, i])) for r in np.flatnonzero(numbers.isna() & text.notna()))
+    return values, _unparsed(failed)
+
+
+def _unparsed(rows):
+    return pd.DataFrame(rows, columns=['Month', 'Column', 'Value'], dtype=object)
+
+
+def month_ordinals(labels):
+    """int32 month ordinals (see ``store.month_ordinals``) of 'Jan-2022' labels.
+
+    Read straight from the text rather than through ``datetime64[ns]``, so
+    histories outside its 1678-2262 range load as well.
+    """
+    parts = pd.Series(labels, dtype=object).str.extract(r'(\w{3})-(\d{4,})')
+    months = parts[0].str.title().map({name: i for i, name in enumerate(MONTH_NAMES)})
+    if months.isna().any():
+        raise ValueError('not a month label: {!r}'.format(labels[int(np.flatnonzero(months.isna())[0])]))
+    return ((parts[1].astype(np.int64) - 1970) * 12 + months).to_numpy(dtype=np.int32)
+
+
+def iter_batches(workbook, sheet_name, start, columns, end=None, footnote=FOOTNOTE, header=1,
+                 batch_rows=BATCH_ROWS, dtype='float64'):
+    """Yield the monthly rows of one header block as ``(months, values, unparsed)`` batches, in sheet order.
+
+    ``months`` are int32 month ordinals (see ``month_ordinals``),
+    ``values`` a ``dtype`` array with a column per name in ``columns`` and
+    ``unparsed`` the cells ``coerce_cells`` could not read. Rows are streamed
+    from the workbook ``batch_rows`` at a time; the footnote and month filters
+    and the coercion run on each batch, so only one batch of cell values is
+    held at once. Reading stops at the first footnote row below the data.
+    """
+    def batch(names, cells):
+        return (month_ordinals(names),) + coerce_cells(names, cells, columns, dtype)
+
+    rows = stream_rows(workbook, sheet_name, header)
+    pattern, month = re.compile(footnote), re.compile(MONTH)
+    try:
+        groups, labels = next(rows), next(rows)
+        positions = _block_positions(sheet_name, list(groups), list(labels), start, columns, end)
+        names, cells = [], []
+        for row in rows:
+            label = str(row[0])
+            if row[0] is not None and pattern.search(label):
+                break
+            if month.search(label):
+                names.append(label)
+                cells.append([row[p] if p < len(row) else None for p in positions])
+                if len(names) == batch_rows:
+                    yield batch(names, cells)
+                    names, cells = [], []
+        if names:
+            yield batch(names, cells)
+    finally:
+        rows.close()
+
+
+def stream_table(workbook, sheet_name, start, columns, end=None, footnote=FOOTNOTE, header=1,
+                 fill=None, limit=2, batch_rows=BATCH_ROWS, dtype='float64'):
+    """Read one header block batch by batch into a ``MonthlyStore``; return ``(values, imputed, unparsed)``.
+
+    With ``fill`` (``ffill``, ``bfill`` or ``seasonal``), gaps of up to
+    ``limit`` months are filled batch by batch as ``transform.fill_gaps``
+    would on the whole table, and ``imputed`` flags the filled cells; it is
+    all False otherwise. ``unparsed`` gathers the cells of every batch that
+    ``coerce_cells`` left empty. Peak memory is the finished arrays plus one
+    batch, however long the sheet.
+    """
+    filler = transform.GapFiller(fill, limit) if fill else None
+    chunks, unparsed = [], [_unparsed([])]
+    for months, values, failed in iter_batches(workbook, sheet_name, start, columns, end, footnote, header,
+                                               batch_rows, dtype):
+        if len(failed):
+            unparsed.append(failed)
+        if filler is None:
+            chunks.append((months, values, np.zeros(values.shape, dtype=bool)))
+        else:
+            chunks.append(filler.push(months, values))
+    if filler is not None:
+        chunks.append(filler.flush())
+
+    months = np.concatenate([c[0] for c in chunks] or [np.empty(0, dtype=np.int32)])
+    order = np.argsort(months, kind='stable')
+    values = np.concatenate([c[1] for c in chunks] or [np.empty((0, len(columns)), dtype=dtype)])[order]
+    imputed = np.concatenate([c[2] for c in chunks] or [np.empty((0, len(columns)), dtype=bool)])[order]
+    del chunks
+    return (store.MonthlyStore(months[order], values, columns), store.MonthlyStore(months[order], imputed, columns),
+            pd.concat(unparsed, ignore_index=True))
+
+
+def normalize_sheet(workbook, sheet_name, start, columns, end=None, footnote=FOOTNOTE,
+                    header=1, cache_dir=CACHE_DIR, reader=READER, unparsed=False):
+    """Return the monthly rows of one header block as a float frame indexed by Month.
+
+    Only the label column and the ``columns`` of the block are read from the
+    workbook; the result is cached for the workbook content and the
+    ``code_version`` of the parser. The ``stream`` reader goes through
+    ``stream_table``, a batch of rows at a time, and stops at the first
+    footnote row below the data. Cells that are not numbers are left
+    empty by ``coerce_cells``; with ``unparsed`` the frame listing them is
+    returned as well, ``(table, unparsed)``. It is cached next to the table.
+    """
+    spec = json.dumps([start, end, list(columns), footnote, header, code_version()])
+    name = 'table-{}-{}'.format(_safe_name(sheet_name), hashlib.sha1(spec.encode()).hexdigest()[:8])
+
+    def parse():
+        with instrument.span('excel parse') as parse:
+            if reader == 'stream':
+                values, _, report = stream_table(workbook, sheet_name, start, columns, end, footnote, header)
+            else:
+                positions = locate_columns(workbook, sheet_name, start, columns, end, header)
+                raw = pd.read_excel(workbook, sheet_name=sheet_name, header=None, skiprows=header + 2,
+                                    usecols=[0] + sorted(positions))
+                raw.columns = ['Month'] + [columns[positions.index(p)] for p in sorted(positions)]
+            parse.rows_out = len(values) if reader == 'stream' else len(raw)
+        with instrument.span('header transform', parse.rows_out) as headers:
+            if reader == 'stream':
+                table = pd.DataFrame(values.values, columns=list(columns),
+                                     index=pd.DatetimeIndex(values.index.to_numpy(), name='Month'))
+            else:
+                label = raw['Month'].astype(str)
+                rows = ~label.str.contains(footnote) & label.str.contains(MONTH)
+                cells, report = coerce_cells(label[rows].tolist(), raw.loc[rows, list(columns)].to_numpy(object),
+                                             columns)
+                table = pd.DataFrame(cells, columns=list(columns), index=pd.DatetimeIndex(
+                    pd.to_datetime(label[rows], format='%b-%Y'), name='Month')).sort_index()
+            headers.rows_out = len(table)
+        return table, report
+
+    def build():
+        table, report = parse()
+        save_frame(cache_path(workbook, name + '-unparsed', cache_dir), report)
+        return table
+
+    with instrument.span('ingest:' + sheet_name) as s:
+        table = cached_frame(workbook, name, build, cache_dir)
+        s.rows_out = len(table)
+    if not unparsed:
+        return table
+    return table, cached_frame(workbook, name + '-unparsed', lambda: parse()[1], cache_dir)
+
+
+def load_table(workbook, name, cache_dir=CACHE_DIR, unparsed=False):
+    """``normalize_sheet`` for one of the tables described in ``SHEETS``."""
+    return normalize_sheet(workbook, cache_dir=cache_dir, unparsed=unparsed, **SHEETS[name])
+
+
+def describe_unparsed(unparsed):
+    """'2 cells could not be parsed: beef 1, veal 1' for an ``unparsed`` frame, '' when it is empty."""
+    if not len(unparsed):
+        return ''
+    counts = unparsed.groupby('Column', sort=False).size()
+    return '{} cells could not be parsed: {}'.format(
+        len(unparsed), ', '.join('{} {}'.format(c, n) for c, n in counts.items()))
+
+
+def release_vintage(path):
+    """Release month of a workbook: the year-month in its file name, else its modification month."""
+    match = re.search(RELEASE_DATE, os.path.basename(path))
+    if match:
+        return pd.Period('{}-{}'.format(*match.groups()), freq='M')
+    return pd.Timestamp(os.stat(path).st_mtime, unit='s').to_period('M')
+
+
+def load_releases(directory=RELEASE_DIR, names=None, max_workers=None, cache_dir=CACHE_DIR):
+    """Load ``names`` (default: every table in ``SHEETS``) from each workbook release in ``directory``.
+
+    Every (workbook, table) pair is parsed in its own worker process and
+    lands in the cache like ``load_table``. Returns ``{name: frame}``, each
+    frame the Month-indexed tables of all releases stacked with a ``Vintage``
+    column (``period[M]``), and ``{(workbook, name): error}`` for the pairs
+    that could not be read, e.g. a sheet missing from an old release or a
+    corrupt or unreadable file.
+    """
+    names = list(names or SHEETS)
+    workbooks = sorted(glob.glob(os.path.join(directory, '*.xlsx')))
+    workbooks = [w for w in workbooks if not os.path.basename(w).startswith('~$')]
+    # hashed up front so the workers find the manifest filled in
+    for workbook in workbooks:
+        workbook_fingerprint(workbook, cache_dir)
+
+    pairs = [(w, n) for w in workbooks for n in names]
+    frames = {n: [] for n in names}
+    errors = {}
+    if pairs:
+        with ProcessPoolExecutor(max_workers) as pool:
+            futures = [pool.submit(load_table, w, n, cache_dir) for w, n in pairs]
+            for (workbook, name), future in zip(pairs, futures):
+                try:
+                    table = future.result()
+                except (KeyError, ValueError, zipfile.BadZipFile, OSError) as e:
+                    errors[(workbook, name)] = e
+                    continue
+                vintage = release_vintage(workbook)
+                frames[name].append(table.assign(Vintage=pd.Series(vintage, index=table.index)))
+
+    tables = {}
+    for name in names:
+        if frames[name]:
+            table = pd.concat(frames[name])
+            tables[name] = table.set_index('Vintage', append=True).sort_index(level=['Vintage', 'Month'])\
+                .reset_index('Vintage')
+    return tables, errors
+
+
+def main(directory=RELEASE_DIR):
+    tables, errors = load_releases(directory)
+    if not tables and not errors:
+        print('no workbooks in {}'.format(directory))
+    for name, table in tables.items():
+        print('{}: {} releases, {} rows'.format(name, table['Vintage'].nunique(), len(table)))
+    for (workbook, name), e in sorted(errors.items()):
+        print('Failed in {} {}: {}'.format(os.path.basename(workbook), name, e))
+    return 1 if errors and not tables else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
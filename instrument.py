@@ -0,0 +1,227 @@
+"""Per-stage timing, memory and request accounting.
+
+While a ``Recorder`` is active, every ``span`` (and every call of a function
+wrapped by ``timed``) records its wall and CPU time, how far it raised the
+process's peak RSS, the tracemalloc peak over its start when tracing, the
+rows it took in and handed out, and the Census requests, bytes and cache hits
+it caused. Without an active recorder ``timed`` functions run untouched.
+
+The records go to JSON and CSV so runs can be compared. With ``profile`` the
+top-level spans also run under cProfile and the stats of the slowest one are
+dumped next to the report, for ``python -m pstats`` or snakeviz.
+"""
+
+import cProfile
+import csv
+import functools
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows, peak RSS is left out there
+    resource = None
+
+FIELDS = ['name', 'depth', 'wall_s', 'cpu_s', 'max_rss_kb', 'rss_growth_kb', 'tracemalloc_peak_kb',
+          'rows_in', 'rows_out', 'requests', 'bytes', 'cache_hits']
+
+_active = threading.local()
+
+
+def _census_stats():
+    # no request can have been made before census is imported, and importing it here would slow every start
+    census = sys.modules.get('census')
+    if census is None:
+        return {'requests': 0, 'bytes': 0, 'cache_hits': 0}
+    with census._stats_lock:
+        return dict(census.STATS)
+
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def rows(value):
+    """Row count of a frame, array, store or ``(frame, ...)`` tuple, else None."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if hasattr(value, 'shape'):
+        return value.shape[0]
+    if hasattr(value, 'months'):
+        return len(value)
+    return None
+
+
+class Span:
+    """One timed block; set ``rows_in``/``rows_out`` on it when the caller knows them."""
+
+    def __init__(self, name, depth, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.record = None
+
+
+class Recorder:
+    """Collects the spans run in this thread while active (``with Recorder() as rec:``)."""
+
+    def __init__(self, trace_memory=False, profile=False):
+        self.records = []
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.slowest = None  # (wall_s, name, cProfile stats) of the slowest top-level span
+        self._depth = 0
+        self._previous = None
+        # per open span, the highest tracemalloc peak seen before its nested spans reset the counter
+        self._peaks = []
+
+    def __enter__(self):
+        self._previous = getattr(_active, 'recorder', None)
+        _active.recorder = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        _active.recorder = self._previous
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def span(self, name, rows_in=None):
+        return _SpanContext(self, name, rows_in)
+
+    def extend(self, records, slowest=None):
+        """Add the records and slowest profile of a recorder run elsewhere, e.g. by ``capture`` in a worker."""
+        for record in records:
+            self.records.append(dict(record, depth=record['depth'] + self._depth))
+        self._keep(slowest)
+
+    def _keep(self, slowest):
+        if slowest is not None and (self.slowest is None or slowest[0] > self.slowest[0]):
+            self.slowest = slowest
+
+    def write(self, prefix):
+        """Write ``prefix.json``, ``prefix.csv`` and, when profiling, ``prefix.prof``; return the paths."""
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        paths = [prefix + '.json', prefix + '.csv']
+        with open(paths[0], 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'spans': self.records}, f, indent=1)
+        with open(paths[1], 'w', newline='') as f:
+            writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.records)
+        if self.slowest is not None:
+            paths.append(prefix + '.prof')
+            with open(paths[-1], 'wb') as f:
+                marshal.dump(self.slowest[2], f)
+        return paths
+
+
+class _SpanContext:
+    def __init__(self, recorder, name, rows_in):
+        self.recorder = recorder
+        self.span = Span(name, recorder._depth, rows_in)
+
+    def __enter__(self):
+        rec = self.recorder
+        rec._depth += 1
+        self.stats = _census_stats()
+        self.rss = _max_rss_kb()
+        self.traced = None
+        if tracemalloc.is_tracing():
+            self.traced, peak = tracemalloc.get_traced_memory()
+            # resetting the peak below would lose the enclosing span's, keep it for that span
+            if rec._peaks:
+                rec._peaks[-1] = max(rec._peaks[-1], peak)
+            rec._peaks.append(0)
+            tracemalloc.reset_peak()
+        self.profiler = cProfile.Profile() if rec.profile and self.span.depth == 0 else None
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self.span
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        rec = self.recorder
+        rec._depth -= 1
+        rss = _max_rss_kb()
+        now = _census_stats()
+        stats = {k: now[k] - self.stats[k] for k in self.stats}
+        record = {
+            'name': self.span.name, 'depth': self.span.depth, 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+            'max_rss_kb': rss, 'rss_growth_kb': None if rss is None else rss - self.rss,
+            'tracemalloc_peak_kb': None, 'rows_in': self.span.rows_in, 'rows_out': self.span.rows_out,
+        }
+        if self.traced is not None:
+            peak = max(tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0, rec._peaks.pop())
+            if rec._peaks:
+                rec._peaks[-1] = max(rec._peaks[-1], peak)
+            record['tracemalloc_peak_kb'] = round((peak - self.traced) / 1024, 1)
+        record.update(stats)
+        self.span.record = record
+        rec.records.append(record)
+        if self.profiler is not None:
+            self.profiler.create_stats()
+            rec._keep((wall, self.span.name, self.profiler.stats))
+
+
+def active():
+    """The recorder active in this thread, or None."""
+    return getattr(_active, 'recorder', None)
+
+
+class _NullSpan:
+    rows_in = rows_out = record = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def span(name, rows_in=None):
+    """``active().span(...)``, or a no-op block when nothing is recording."""
+    rec = active()
+    return rec.span(name, rows_in) if rec is not None else _NullSpan()
+
+
+def timed(name):
+    """Decorator recording each call as a span, rows taken from the first argument and the result."""
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rec = active()
+            if rec is None:
+                return func(*args, **kwargs)
+            with rec.span(name, rows(args[0]) if args else None) as s:
+                result = func(*args, **kwargs)
+                s.rows_out = rows(result)
+            return result
+        return wrapper
+    return wrap
+
+
+def capture(name, func, args=(), kwargs=None, trace_memory=False, profile=False):
+    """Run ``func`` as span ``name`` of a fresh recorder; return ``(value, records, slowest)``.
+
+    For worker processes: the parent hands the last two to ``Recorder.extend``.
+    """
+    with Recorder(trace_memory, profile) as rec:
+        with rec.span(name, rows(args[0]) if args else None) as s:
+            value = func(*args, **(kwargs or {}))
+            s.rows_out = rows(value)
+    return value, rec.records, rec.slowest
@@ -0,0 +1,69 @@
+"""Monthly per-capita meat production and slaughter weight.
+
+The Census estimates give the resident population on July 1 of each year.
+``monthly_population`` places each estimate on its July and interpolates
+linearly between them onto any monthly index; months before the first or after
+the last July stay empty rather than being extrapolated. ``per_capita``
+divides every type of a ``MonthlyStore`` by that population at once.
+
+The results are cached next to the normalized tables, keyed on the workbook
+and on the content of the population and monthly frames, so the per-capita
+charts do not redo the join.
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import instrument
+import store
+
+REFERENCE_MONTH = 7  # the estimates are for July 1
+
+
+def monthly_population(pop, months):
+    """``pop`` (Year/Pop) interpolated onto the int32 month ordinals ``months``, NaN outside its Julys."""
+    pop = pop.sort_values('Year')
+    anchors = (pop['Year'].to_numpy(dtype=np.int64) - 1970) * 12 + REFERENCE_MONTH - 1
+    return np.interp(months, anchors, pop['Pop'].to_numpy(dtype=float), left=np.nan, right=np.nan)
+
+
+@instrument.timed('per capita')
+def per_capita(values, pop, scale=1):
+    """``values * scale / population`` for every month and type of the ``values`` store."""
+    out = np.empty(values.values.shape)
+    np.divide(values.values, monthly_population(pop, values.months)[:, None], out=out)
+    if scale != 1:
+        out *= scale
+    return store.MonthlyStore(values.months, out, values.types)
+
+
+def production_per_capita(meat_prod, pop):
+    """Pounds of meat produced per resident and month, by type; ``meat_prod`` is in million pounds."""
+    return per_capita(store.MonthlyStore.from_frame(meat_prod), pop, 1000000).to_frame()
+
+
+def slaughter_per_capita(slau_weight2, pop):
+    """Pounds slaughtered (live weight) per resident and month, by type."""
+    return per_capita(store.MonthlyStore.from_long(slau_weight2, 'weight'), pop).to_frame()
+
+
+def _digest(*frames):
+    digest = hashlib.sha256()
+    for frame in frames:
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:12]
+
+
+def cached_per_capita(workbook, meat_prod, slau_weight2, pop, cache_dir=ingest.CACHE_DIR):
+    """``{'meat_prod_per_capita': frame, 'slau_weight_per_capita': frame}``, from the cache when current."""
+    return {
+        'meat_prod_per_capita': ingest.cached_frame(
+            workbook, 'percapita-meat_prod-' + _digest(meat_prod, pop),
+            lambda: production_per_capita(meat_prod, pop), cache_dir),
+        'slau_weight_per_capita': ingest.cached_frame(
+            workbook, 'percapita-slau_weight-' + _digest(slau_weight2[['Month', 'Types', 'weight']], pop),
+            lambda: slaughter_per_capita(slau_weight2, pop), cache_dir),
+    }
@@ -0,0 +1,386 @@
+"""The analysis as a graph of named, memoized stages.
+
+Each ``Stage`` names the stages it reads, the code it depends on and the
+files it watches. Its output is stored under ``data/.cache/stages`` keyed on
+a hash of that code, of its parameters, of the watched files' contents and of
+its inputs' contents, so a run only executes the stages whose key moved:
+restyling one chart re-renders that chart without touching the Excel parse or
+the Census API. The population stage also expires with the Census response
+cache, so vintages that failed or were not out yet are asked for again.
+``Pipeline.run`` executes the stages whose inputs are ready across a process
+pool, so the production, slaughter and population branches run side by side.
+
+    python pipeline.py                       # everything
+    python pipeline.py chart:us_population   # one target and what it needs
+    python pipeline.py --force population    # re-run a stage even though it is current
+    python pipeline.py --report runs/today   # also time every stage into runs/today.json/.csv
+    python pipeline.py transform             # one step: ingest, transform, population or render
+
+Plotting libraries and the Census client are only imported by the stages
+that use them, so a scheduled ``ingest`` or ``transform`` run starts about as
+fast as pandas imports.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+import cube
+import ingest
+import instrument
+import percapita
+import refresh
+import render
+import store
+import transform
+
+STAGE_DIR = os.path.join(ingest.CACHE_DIR, 'stages')
+
+
+class Stage:
+    """One step of the analysis: ``func(*inputs, **params)``.
+
+    ``inputs`` name other stages, or one frame of a stage returning a dict as
+    ``'stage.key'``. ``code`` lists the functions and modules whose source
+    goes into the key besides ``func``; a module given by name is hashed from
+    its file without importing it. ``watch`` lists the files whose content
+    does. A stage returns a DataFrame, a dict of DataFrames or JSON; with
+    ``files`` it returns a list of paths, and its stored output only counts
+    while they hold what the stage wrote. With ``ttl`` (seconds, or a
+    function returning them, called only when a stored output is checked) an
+    output older than that is produced again, for stages reading sources
+    that change under the same key.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, code=(), watch=(), files=False, ttl=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.code = [func] + list(code)
+        self.watch = list(watch)
+        self.files = files
+        self.ttl = ttl
+
+    def __repr__(self):
+        return '<Stage {} <- {}>'.format(self.name, ', '.join(self.inputs) or '()')
+
+    @property
+    def needs(self):
+        return {ref.split('.', 1)[0] for ref in self.inputs}
+
+    def key(self, input_hashes):
+        digest = hashlib.sha256()
+        for obj in self.code:
+            if isinstance(obj, str):
+                with open(importlib.util.find_spec(obj).origin, 'rb') as f:
+                    digest.update(f.read())
+            else:
+                digest.update(inspect.getsource(obj).encode())
+        digest.update(json.dumps(self.params, sort_keys=True, default=str).encode())
+        for path in self.watch:
+            digest.update(ingest.workbook_fingerprint(path).encode())
+        for ref in self.inputs:
+            digest.update(input_hashes[ref].encode())
+        return digest.hexdigest()
+
+
+def content_hash(value):
+    """Hash of a stage output: frame contents, or JSON text."""
+    digest = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        digest.update(json.dumps([str(c) for c in value.columns] + [str(t) for t in value.dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def output_hashes(name, value):
+    """``{ref: hash}`` for a stage output and, for dicts of frames, each of its frames."""
+    if isinstance(value, dict) and all(isinstance(v, pd.DataFrame) for v in value.values()):
+        hashes = {'{}.{}'.format(name, k): content_hash(v) for k, v in value.items()}
+        hashes[name] = hashlib.sha256(''.join(sorted(hashes.values())).encode()).hexdigest()
+        return hashes
+    return {name: content_hash(value)}
+
+
+def _memo_dir(cache_dir, name, key):
+    return os.path.join(cache_dir, '{}-{}'.format(ingest._safe_name(name), key[:16]))
+
+
+def _file_hashes(paths):
+    return [ingest.file_hash(p) if os.path.exists(p) else None for p in paths]
+
+
+def save_output(path, value, files=False):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    os.makedirs(tmp)
+    if isinstance(value, pd.DataFrame):
+        ingest.save_frame(os.path.join(tmp, 'frame.npz'), value)
+        kind = 'frame'
+    elif isinstance(value, dict) and all(isinstance(v, pd.DataFrame) for v in value.values()):
+        for i, frame in enumerate(value.values()):
+            ingest.save_frame(os.path.join(tmp, '{}.npz'.format(i)), frame)
+        kind = 'frames'
+    else:
+        kind = 'json'
+    with open(os.path.join(tmp, 'output.json'), 'w') as f:
+        json.dump({'kind': kind, 'keys': list(value) if kind == 'frames' else None,
+                   'value': value if kind == 'json' else None,
+                   'files': _file_hashes(value) if files else None, 'created': time.time()},
+                  f, indent=1, default=str)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def load_output(path, files=False, ttl=None):
+    with open(os.path.join(path, 'output.json')) as f:
+        meta = json.load(f)
+    if files and _file_hashes(meta['value']) != meta['files']:
+        # written over by a run with other code, or deleted
+        raise ValueError('files of {} changed'.format(path))
+    if ttl is not None and time.time() - meta.get('created', 0) > ttl:
+        raise ValueError('{} expired'.format(path))
+    if meta['kind'] == 'frame':
+        return ingest.load_frame(os.path.join(path, 'frame.npz'))
+    if meta['kind'] == 'frames':
+        return {k: ingest.load_frame(os.path.join(path, '{}.npz'.format(i))) for i, k in enumerate(meta['keys'])}
+    return meta['value']
+
+
+def _call(func, args, params):
+    return func(*args, **params)
+
+
+class Pipeline:
+    """Run ``stages`` in dependency order, skipping the ones whose stored output is current."""
+
+    def __init__(self, stages, cache_dir=STAGE_DIR, max_workers=None):
+        self.stages = {s.name: s for s in stages}
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        for s in stages:
+            unknown = s.needs - set(self.stages)
+            if unknown:
+                raise KeyError('stage {} reads unknown stages {}'.format(s.name, sorted(unknown)))
+
+    def upstream(self, targets):
+        """``targets`` and every stage they read, directly or not."""
+        seen, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in seen:
+                seen.add(name)
+                todo.extend(self.stages[name].needs)
+        return seen
+
+    def _cached(self, stage, key):
+        path = _memo_dir(self.cache_dir, stage.name, key)
+        ttl = stage.ttl() if callable(stage.ttl) else stage.ttl
+        try:
+            return load_output(path, stage.files, ttl)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def run(self, targets=None, force=()):
+        """Return ``({stage: output}, {stage: status})`` for ``targets`` (default: all).
+
+        A stage's status is ``ran``, ``cached``, ``failed: <error>`` or
+        ``skipped`` when a stage it reads failed. Stages in ``force`` run even
+        when their stored output is current.
+        """
+        wanted = self.upstream(targets or self.stages)
+        outputs, hashes, status = {}, {}, {}
+        rec = instrument.active()
+        running = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with ProcessPoolExecutor(self.max_workers) as pool:
+            while len(status) < len(wanted):
+                busy = {name for name, _ in running.values()}
+                for name in sorted(wanted - set(status) - busy):
+                    stage = self.stages[name]
+                    if not stage.needs <= set(status):
+                        continue
+                    if any(status[n] not in ('ran', 'cached') for n in stage.needs):
+                        status[name] = 'skipped'
+                        continue
+                    key = stage.key(hashes)
+                    with instrument.span('cache:' + name):
+                        value = None if name in force else self._cached(stage, key)
+                    if value is not None:
+                        self._finish(stage, value, outputs, hashes)
+                        status[name] = 'cached'
+                        continue
+                    args = [outputs[ref] if ref in outputs else outputs[ref.split('.', 1)[0]][ref.split('.', 1)[1]]
+                            for ref in stage.inputs]
+                    if rec is None:
+                        future = pool.submit(_call, stage.func, args, stage.params)
+                    else:
+                        # the stage runs under its own recorder in the worker, handing back its spans
+                        future = pool.submit(instrument.capture, 'stage:' + name, _call,
+                                             (stage.func, args, stage.params),
+                                             trace_memory=rec.trace_memory, profile=rec.profile)
+                    running[future] = (name, key)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = running.pop(future)
+                    try:
+                        value = future.result()
+                        if rec is not None:
+                            value, records, slowest = value
+                            rec.extend(records, slowest)
+                    except Exception as e:
+                        status[name] = 'failed: {}: {}'.format(type(e).__name__, e)
+                        continue
+                    self._finish(self.stages[name], value, outputs, hashes)
+                    save_output(_memo_dir(self.cache_dir, name, key), value, self.stages[name].files)
+                    status[name] = 'ran'
+        return outputs, status
+
+    def _finish(self, stage, value, outputs, hashes):
+        outputs[stage.name] = value
+        hashes.update(output_hashes(stage.name, value))
+
+
+def production(meat_prod):
+    return refresh.refresh('production', {'meat_prod': meat_prod}, refresh.production)[0]
+
+
+def slaughter(slau_count, slau_avg_weight):
+    return refresh.refresh('slaughter', {'slau_count': slau_count, 'slau_avg_weight': slau_avg_weight},
+                           refresh.slaughter)[0]
+
+
+def aggregates(meat_prod, slau_count, slau_weight2):
+    """Update the aggregate cube and return the growth of every series since 1990."""
+    return cube.refresh_cube(meat_prod, slau_count, slau_weight2)[0].growth_table()
+
+
+def yearly_population(last_year):
+    import census
+    import population
+
+    with census.Fetcher(max_workers=16, rate=50, cache=census.ResponseCache()) as client:
+        return population.yearly_population(client, last_year=last_year)[0]
+
+
+def population_ttl():
+    """The shortest time the response cache keeps any Census answer fresh.
+
+    A vintage that failed is asked for again after ``census.ERROR_TTL`` and
+    the variable lists after their own TTL, so the population stage is not
+    kept for longer than the responses it was built from.
+    """
+    import census
+
+    return min([census.ERROR_TTL, census.DEFAULT_TTL] + [ttl for _, ttl in census.TTLS if ttl is not None])
+
+
+def per_capita(meat_prod, slau_weight2, pop):
+    return {'meat_prod_per_capita': percapita.production_per_capita(meat_prod, pop),
+            'slau_weight_per_capita': percapita.slaughter_per_capita(slau_weight2, pop)}
+
+
+def chart(*frames, name, out_dir=render.FIGURE_DIR, formats=render.FORMATS):
+    os.makedirs(out_dir, exist_ok=True)
+    keys = render.FIGURES[name][0]
+    return render._render(name, dict(zip(keys, frames)), out_dir, list(formats))
+
+
+# which stage output each chart frame comes from
+FRAMES = {
+    'meat_prod': 'production.meat_prod', 'meat_prod3': 'production.meat_prod3',
+    'slau_count': 'slaughter.slau_count', 'slau_weight2': 'slaughter.slau_weight2',
+    'slau_weight3': 'slaughter.slau_weight3', 'population': 'population',
+    'meat_prod_per_capita': 'per_capita.meat_prod_per_capita',
+    'slau_weight_per_capita': 'per_capita.slau_weight_per_capita',
+}
+CHART_CODE = render.HELPERS
+# latest Census population vintage asked for
+LAST_YEAR = 2021
+
+
+def analysis(workbook=refresh.WORKBOOK, out_dir=render.FIGURE_DIR, formats=render.FORMATS, last_year=LAST_YEAR):
+    """The stages of the report: USDA tables, the two pipelines, aggregates, population, per capita, charts.
+
+    Population is fetched up to the ``last_year`` vintage.
+    """
+    # the modules ingest.code_version hashes, so the stage runs again exactly when the parsed tables do
+    stages = [Stage(name, ingest.load_table, params={'workbook': workbook, 'name': name},
+                    code=[ingest, transform, store], watch=[workbook])
+              for name in ingest.SHEETS]
+    stages += [
+        Stage('production', production, ['meat_prod'], code=[refresh.production, transform, store]),
+        Stage('slaughter', slaughter, ['slau_count', 'slau_avg_weight'],
+              code=[refresh.slaughter, transform, store]),
+        Stage('cube', aggregates, ['production.meat_prod', 'slaughter.slau_count', 'slaughter.slau_weight2'],
+              code=[cube, store]),
+        Stage('population', yearly_population, params={'last_year': last_year}, code=['census', 'population'],
+              ttl=population_ttl),
+        Stage('per_capita', per_capita, ['production.meat_prod', 'slaughter.slau_weight2', 'population'],
+              code=[percapita, store]),
+    ]
+    for name, (keys, draw) in render.FIGURES.items():
+        stages.append(Stage('chart:' + name, chart, [FRAMES[k] for k in keys],
+                            params={'name': name, 'out_dir': out_dir, 'formats': list(formats)},
+                            code=[draw] + CHART_CODE, files=True))
+    return stages
+
+
+def expand(names, stages):
+    """Stage names for ``names``, a step (ingest, transform, population, render) standing for its stages."""
+    steps = {'ingest': list(ingest.SHEETS), 'transform': ['production', 'slaughter', 'cube'],
+             'population': ['population', 'per_capita'], 'render': [s.name for s in stages if s.files]}
+    out = []
+    for name in names:
+        out.extend(n for n in steps.get(name, [name]) if n not in out)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('targets', nargs='*',
+                        help='stages or steps (ingest, transform, population, render) to bring up to date '
+                             '(default: all)')
+    parser.add_argument('--force', action='append', default=[], help='re-run this stage, repeatable')
+    parser.add_argument('-w', '--workbook', default=refresh.WORKBOOK)
+    parser.add_argument('-o', '--out', default=render.FIGURE_DIR, help='chart directory (default: %(default)s)')
+    parser.add_argument('--last-year', type=int, default=LAST_YEAR,
+                        help='latest Census population vintage to fetch (default: %(default)s)')
+    parser.add_argument('--report', metavar='PREFIX',
+                        help='write the time, memory, rows and requests of every stage to PREFIX.json and PREFIX.csv')
+    parser.add_argument('--trace-memory', action='store_true', help='with --report, also trace allocations')
+    parser.add_argument('--profile', action='store_true',
+                        help='with --report, dump cProfile stats of the slowest stage to PREFIX.prof')
+    args = parser.parse_args(argv)
+
+    stages = analysis(args.workbook, args.out, last_year=args.last_year)
+    pipeline = Pipeline(stages)
+    targets, force = expand(args.targets, stages) or None, set(expand(args.force, stages))
+    if args.report:
+        with instrument.Recorder(args.trace_memory, args.profile) as rec:
+            _, status = pipeline.run(targets, force=force)
+        print('report: {}'.format(', '.join(rec.write(args.report))))
+    else:
+        _, status = pipeline.run(targets, force=force)
+    for name in sorted(status):
+        print('{}: {}'.format(name, status[name]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Yearly US resident population stitched together from the Census estimate vintages.
+
+No single Census dataset covers 1990 to today, so the series is built from the
+1990s and 2000s intercensal estimates, the 2012 projection, the 2013-2014
+vintage estimates and the 2015+ population estimates. Every value fetched is
+kept in a ``PopulationStore`` as one observation (period, geography, source,
+vintage, reference date), and the series is resolved from them in one pass:
+for each year the source ranked highest in ``SOURCES`` wins, then the newest
+vintage, then the latest reference date. Zeros are treated as missing.
+"""
+
+import numpy as np
+import pandas as pd
+
+import census
+import instrument
+
+# lowest precedence first, the order the notebook overwrote the years in
+SOURCES = ('pep/int_natrespop', 'pep/int_population', 'popproj/pop', 'pep/natstprc', 'pep/population')
+FREQS = ('Y', 'M')
+_COLUMNS = {'period': np.int32, 'freq': np.int8, 'geo': np.int32, 'source': np.int8, 'vintage': np.int16,
+            'reference': 'datetime64[D]', 'value': np.int64}
+
+
+class PopulationStore:
+    """Population observations in typed column arrays, resolved to one value per period and geography.
+
+    Periods are stored as ordinals of their ``freq``, geographies and
+    sources as small integer codes. ``add`` appends a batch as a chunk that
+    is concatenated when the columns are next read, so monthly or
+    state-level series cost a few bytes per value.
+    """
+
+    def __init__(self, sources=SOURCES):
+        self.sources = list(sources)
+        self.geos = []
+        self._chunks = []
+        self._columns = {name: np.empty(0, dtype) for name, dtype in _COLUMNS.items()}
+
+    def add(self, source, periods, values, vintage=0, freq='Y', geo='us', reference=None):
+        """Record ``values`` of ``source`` for ``periods`` (years, or anything ``pd.Period`` reads).
+
+        ``geo`` is one geography or one per value, ``vintage`` the year of
+        the release and ``reference`` the date each value refers to, when the
+        source says.
+        """
+        values = np.asarray(values, dtype=np.int64)
+        n = len(values)
+        geos = pd.Index(np.broadcast_to(np.asarray(geo, dtype=object), n))
+        self.geos.extend(g for g in geos.unique() if g not in self.geos)
+        reference = np.asarray('NaT' if reference is None else reference, dtype='datetime64[D]')
+        self._chunks.append({
+            'period': pd.PeriodIndex([str(p) for p in periods], freq=freq).asi8.astype(np.int32),
+            'freq': np.full(n, FREQS.index(freq), dtype=np.int8),
+            'geo': pd.Index(self.geos).get_indexer(geos).astype(np.int32),
+            'source': np.full(n, self.sources.index(source), dtype=np.int8),
+            'vintage': np.full(n, vintage, dtype=np.int16),
+            'reference': np.broadcast_to(reference, n),
+            'value': values,
+        })
+        return self
+
+    @property
+    def columns(self):
+        if self._chunks:
+            self._columns = {name: np.concatenate([self._columns[name]] + [c[name] for c in self._chunks])
+                             for name in _COLUMNS}
+            self._chunks = []
+        return self._columns
+
+    def __len__(self):
+        return len(self.columns['value'])
+
+    def __repr__(self):
+        cols = self.columns
+        return '<PopulationStore: {} observations from {} sources, {} geographies, {} bytes>'.format(
+            len(self), len(np.unique(cols['source'])), len(self.geos), sum(a.nbytes for a in cols.values()))
+
+    def to_frame(self):
+        """Every observation, one row each."""
+        cols = self.columns
+        return pd.DataFrame({
+            'period': [str(pd.Period(ordinal=int(o), freq=FREQS[f])) for o, f in zip(cols['period'], cols['freq'])],
+            'geo': np.asarray(self.geos + [None], dtype=object)[cols['geo']],
+            'source': np.asarray(self.sources, dtype=object)[cols['source']],
+            'vintage': cols['vintage'], 'reference': cols['reference'], 'value': cols['value'],
+        })
+
+    def resolve(self, freq='Y', geo='us', provenance=False):
+        """The preferred value for every period of ``freq`` in ``geo`` (in every geography for None).
+
+        Returns ``Year``/``Pop`` for yearly series and ``Month``/``Pop`` for
+        monthly ones, sorted by period, with a leading ``Geo`` column when
+        ``geo`` is None and the winning ``Source`` and ``Vintage`` with
+        ``provenance``.
+        """
+        cols = self.columns
+        keep = (cols['freq'] == FREQS.index(freq)) & (cols['value'] > 0)
+        if geo is not None:
+            keep &= cols['geo'] == (self.geos.index(geo) if geo in self.geos else -1)
+        picked = {name: a[keep] for name, a in cols.items()}
+
+        # sorted by geography and period, then by precedence: the last row of each pair wins
+        order = np.lexsort((picked['reference'].astype(np.int64), picked['vintage'], picked['source'],
+                            picked['period'], picked['geo']))
+        geos, periods = picked['geo'][order], picked['period'][order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (geos[1:] != geos[:-1]) | (periods[1:] != periods[:-1])
+        won = order[last]
+
+        index = pd.PeriodIndex(pd.arrays.PeriodArray(picked['period'][won].astype(np.int64),
+                                                     dtype=pd.PeriodDtype(freq)))
+        df = pd.DataFrame({'Year': index.year.astype(np.int64)} if freq == 'Y'
+                          else {'Month': index.to_timestamp()})
+        if geo is None:
+            df.insert(0, 'Geo', np.asarray(self.geos, dtype=object)[picked['geo'][won]])
+        df['Pop'] = picked['value'][won]
+        if provenance:
+            df['Source'] = np.asarray(self.sources, dtype=object)[picked['source'][won]]
+            df['Vintage'] = picked['vintage'][won]
+        return df
+
+
+def _value(fetcher, link):
+    return int(fetcher.fetch_json(link)[1][1])
+
+
+def population_store(fetcher, base_url=census.BASE_URL, key='', last_year=2021):
+    """Fetch every source into a ``PopulationStore``; return it and ``{year: error}`` for the vintages that failed."""
+    resolver = census.SchemaResolver(fetcher, base_url)
+    pop, misses = PopulationStore(), {}
+
+    # 1990-2000 intercensal estimates
+    with instrument.span('api:1990/pep/int_natrespop') as s:
+        rows = fetcher.fetch_json('{}/1990/pep/int_natrespop?get=YEAR,TOT_POP&key={}'.format(base_url, key))
+        pop.add('pep/int_natrespop', [row[0] for row in rows[1:]], [row[1] for row in rows[1:]], vintage=1990)
+        s.rows_out = len(rows) - 1
+
+    # 2000-2010 intercensal estimates; DATE_ 1 is 2000
+    with instrument.span('api:2000/pep/int_population') as s:
+        rows = fetcher.fetch_json('{}/2000/pep/int_population?get=GEONAME,POP,DATE_&for=us:1&key={}'.format(
+            base_url, key))
+        pop.add('pep/int_population', [1999 + int(row[2]) for row in rows[1:]], [row[1] for row in rows[1:]],
+                vintage=2000)
+        s.rows_out = len(rows) - 1
+
+    with instrument.span('api:2012/popproj/pop') as s:
+        value = _value(fetcher, '{}/2012/popproj/pop?get=YEAR,TOTAL_POP&key={}'.format(base_url, key))
+        pop.add('popproj/pop', [2012], [value], vintage=2012)
+        s.rows_out = 1
+
+    # 2013's DATE_ is 6 and 2014's is 7
+    with instrument.span('api:pep/natstprc') as s:
+        for year in range(2013, 2015):
+            value = _value(fetcher, '{}/{}/pep/natstprc?get=STNAME,POP&for=us:*&DATE_={}&key={}'.format(
+                base_url, year, year - 2007, key))
+            pop.add('pep/natstprc', [year], [value], vintage=year)
+        s.rows_out = 2
+
+    with instrument.span('api:pep/population') as s:
+        for year in range(2015, last_year + 1):
+            dataset = '{}/pep/population'.format(year)
+            try:
+                variables = resolver.resolve(dataset, ('GEONAME', 'POP'), ('NAME', 'POP'),
+                                             ('NAME', 'POP_' + str(year)))
+                value = _value(fetcher, '{}/{}?get={}&for=us:*&key={}'.format(
+                    base_url, dataset, ','.join(variables), key))
+                pop.add('pep/population', [year], [value], vintage=year)
+            except census.FETCH_ERRORS as e:
+                misses[year] = e
+        s.rows_out = last_year - 2014 - len(misses)
+    return pop, misses
+
+
+CPS_YEARS = range(1989, 2023)
+CPS_MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+
+def cps_counts(fetcher, base_url=census.BASE_URL, key='', years=CPS_YEARS, months=CPS_MONTHS, count=None):
+    """Records in every CPS basic monthly file: ``{(year, month): rows}`` and ``{(year, month): error}``.
+
+    The age variable is resolved per month from ``variables.json``, and all
+    months are requested through the fetcher's pool. ``count`` turns a data
+    URL into its row count; the default streams the body through
+    ``fetcher.count_rows`` without keeping it.
+    """
+    resolver = census.SchemaResolver(fetcher, base_url)
+    count = fetcher.count_rows if count is None else count
+    misses = {}
+
+    def month_count(pair):
+        dataset = '{}/cps/basic/{}'.format(*pair)
+        try:
+            variable = resolver.resolve(dataset, 'A_AGE', 'PRTAGE')
+            return count('{}/{}?get={}&key={}'.format(base_url, dataset, variable, key))
+        except census.FETCH_ERRORS as e:
+            misses[pair] = e
+            return None
+
+    pairs = [(year, month) for year in years for month in months]
+    with instrument.span('api:cps/basic') as s:
+        counts = {pair: n for pair, n in zip(pairs, fetcher.map(month_count, pairs)) if n is not None}
+        s.rows_out = len(counts)
+    return counts, misses
+
+
+def yearly_population(fetcher, base_url=census.BASE_URL, key='', last_year=2021):
+    """Return a Year/Pop frame and ``{year: error}`` for the vintages that failed."""
+    pop, misses = population_store(fetcher, base_url, key, last_year)
+    return pop.resolve('Y'), misses
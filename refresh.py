@@ -0,0 +1,240 @@
+"""Incremental refresh of the monthly USDA tables.
+
+USDA appends a few months (and sometimes revises recent ones) with each
+release, yet the analysis used to rebuild every frame back to the 1920s. For
+each pipeline ``refresh`` keeps the normalized input tables and the derived
+frames of the last run under ``data/.cache/state``. It compares row hashes to
+find the new, revised or dropped months, and recomputes only the calendar
+years the gap fill and the annualized latest year let them reach, before
+splicing them into the stored frames.
+
+Whole years are recomputed because the quarterly correction and the yearly
+totals work per calendar year. The state also records a hash of the code that
+produced it, and is rebuilt in full when that code changes.
+
+    python refresh.py            # refresh all pipelines from data/meat_statistics.xlsx
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import store
+import transform
+
+STATE_DIR = os.path.join(ingest.CACHE_DIR, 'state')
+WORKBOOK = os.path.join('data', 'meat_statistics.xlsx')
+
+
+def row_hashes(table):
+    return pd.util.hash_pandas_object(table, index=False)
+
+
+def changed_months(old, new):
+    """Months that are new in ``new``, dropped from it, or hold different values."""
+    old_hashes, new_hashes = row_hashes(old), row_hashes(new)
+    common = old_hashes.index.intersection(new_hashes.index)
+    revised = common[old_hashes[common].to_numpy() != new_hashes[common].to_numpy()]
+    added = new_hashes.index.difference(old_hashes.index)
+    dropped = old_hashes.index.difference(new_hashes.index)
+    return revised.union(added).union(dropped)
+
+
+def period_years(frame):
+    """Calendar year of every row, from its Month or Year column or index."""
+    for name in ('Month', 'Year'):
+        if name in frame.columns:
+            values = frame[name]
+        elif name in frame.index.names:
+            values = frame.index.get_level_values(name).to_series(index=frame.index)
+        else:
+            continue
+        if isinstance(values.dtype, pd.PeriodDtype) or values.dtype.kind == 'M':
+            return values.dt.year.to_numpy()
+        return values.astype(int).to_numpy()
+    raise KeyError('frame has no Month or Year to splice on')
+
+
+def affected_years(inputs, changed, limit, high_water_mark=None):
+    """Calendar years whose frames can move when ``changed`` months change.
+
+    Besides the years holding them, the gap fill reaches ``limit`` rows
+    either side of a changed (or dropped) month, and the latest year is only
+    annualized while it is the latest: when the last month moves past the
+    old ``high_water_mark`` (a 'YYYY-MM' string), that year is redone too.
+    """
+    months = pd.DatetimeIndex([])
+    for table in inputs.values():
+        months = months.union(table.index)
+    years = set(changed.year)
+    if len(months):
+        pos = np.searchsorted(months, changed)
+        near = (pos[:, None] + np.arange(-limit - 1, limit + 1)[None, :]).ravel()
+        years.update(months[np.clip(near, 0, len(months) - 1)].year)
+        if high_water_mark is not None and months.max().strftime('%Y-%m') != high_water_mark:
+            years.add(int(high_water_mark[:4]))
+    return np.array(sorted(years), dtype=int)
+
+
+def _recompute(inputs, prepare, years, limit):
+    """``prepare`` over the rows of ``years`` plus ``limit`` rows either side, keeping only those years.
+
+    The halo is what a gap fill of at most ``limit`` rows can read, so
+    stacking the separate runs of rows into one call gives the same values
+    for the kept years as preparing the whole history.
+    """
+    months = pd.DatetimeIndex([])
+    for table in inputs.values():
+        months = months.union(table.index)
+    pos = np.flatnonzero(np.isin(months.year, years))
+    context = np.zeros(len(months), dtype=bool)
+    for shift in range(-limit, limit + 1):
+        context[np.clip(pos + shift, 0, len(months) - 1)] = True
+
+    result = prepare({name: table[table.index.isin(months[context])] for name, table in inputs.items()})
+    return {key: frame[np.isin(period_years(frame), years)] for key, frame in result.items()}
+
+
+def code_version(prepare, modules=(transform, store)):
+    """Hash of the source of ``prepare`` and of the ``modules`` it builds on.
+
+    The saved state only holds frames, so it is dropped when this moves:
+    splicing the output of new code into frames of the old would mix both.
+    """
+    digest = hashlib.sha256(inspect.getsource(prepare).encode())
+    for module in modules:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()[:16]
+
+
+def _state_path(state_dir, name, key):
+    return os.path.join(state_dir, '{}-{}.npz'.format(name, key))
+
+
+def load_state(name, state_dir=STATE_DIR):
+    try:
+        with open(os.path.join(state_dir, name + '.json')) as f:
+            meta = json.load(f)
+        inputs = {k: ingest.load_frame(_state_path(state_dir, name, 'input-' + k)) for k in meta['inputs']}
+        outputs = {k: ingest.load_frame(_state_path(state_dir, name, k)) for k in meta['outputs']}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return meta, inputs, outputs
+
+
+def save_state(name, inputs, outputs, state_dir=STATE_DIR, version=None):
+    os.makedirs(state_dir, exist_ok=True)
+    for key, frame in inputs.items():
+        ingest.save_frame(_state_path(state_dir, name, 'input-' + key), frame)
+    for key, frame in outputs.items():
+        ingest.save_frame(_state_path(state_dir, name, key), frame)
+    meta = {'inputs': list(inputs), 'outputs': list(outputs), 'version': version,
+            'high_water_mark': max(t.index.max() for t in inputs.values()).strftime('%Y-%m')}
+    with open(os.path.join(state_dir, name + '.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+def refresh(name, inputs, prepare, limit=2, state_dir=STATE_DIR, version=None):
+    """Return ``prepare(inputs)``, recomputing only what changed since the last run of ``name``.
+
+    ``inputs`` maps names to Month-indexed tables sorted by month. ``prepare``
+    takes a dict shaped like ``inputs`` and returns a dict of frames, each with
+    a Month or Year column and sorted by it. It may combine rows of the same
+    calendar year and fill gaps of up to ``limit`` months (a ``seasonal``
+    fill reads a year back, so it needs ``limit`` of at least 12). The state
+    saved by another ``version`` of the code (default: ``code_version``) is
+    rebuilt from scratch. Returns the frames and the months that changed.
+    """
+    version = code_version(prepare) if version is None else version
+    state = load_state(name, state_dir)
+    if state is None or set(state[1]) != set(inputs) or state[0].get('version') != version:
+        outputs = prepare(inputs)
+        save_state(name, inputs, outputs, state_dir, version)
+        return outputs, max((t.index for t in inputs.values()), key=len)
+
+    meta, old_inputs, outputs = state
+    changed = pd.DatetimeIndex([])
+    for key, table in inputs.items():
+        changed = changed.union(changed_months(old_inputs[key], table))
+    if changed.empty:
+        return outputs, changed
+
+    years = affected_years(inputs, changed, limit, meta.get('high_water_mark'))
+    fresh = _recompute(inputs, prepare, years, limit)
+    for key, frame in outputs.items():
+        kept = frame[~np.isin(period_years(frame), years)]
+        merged = pd.concat([kept, fresh.get(key, frame.iloc[:0])])
+        order = np.argsort(period_years(merged), kind='stable')
+        outputs[key] = merged.iloc[order] if isinstance(merged.index, pd.DatetimeIndex) \
+            else merged.iloc[order].reset_index(drop=True)
+    save_state(name, inputs, outputs, state_dir, version)
+    return outputs, changed
+
+
+def production(inputs):
+    """Quarterly fix, gap fill and yearly totals of the meat production table.
+
+    The monthly table stays wide; the charts melt it when they draw it.
+    """
+    meat_prod, imputed = transform.fill_gaps(transform.quarterly_to_monthly(inputs['meat_prod'].reset_index()),
+                                             'bfill', limit=2)
+    meat_prod2 = store.MonthlyStore.from_frame(meat_prod).melt(var_name='variable')
+    meat_prod3 = transform.yearly_totals(meat_prod2, ['value'], by='variable',
+                                         imputed=store.MonthlyStore.from_frame(imputed, dtype=bool).ravel())
+    meat_prod3['value_in_billion'] = meat_prod3['value'] * meat_prod3['scale'] / 1000
+    return {'meat_prod': meat_prod, 'meat_prod3': meat_prod3}
+
+
+def slaughter(inputs):
+    """Slaughter counts and average weights combined into yearly total weights."""
+    slau_count, count_imputed = transform.fill_gaps(
+        transform.quarterly_to_monthly(inputs['slau_count'].reset_index()), 'bfill', limit=2)
+    weights, weight_imputed = transform.fill_gaps(inputs['slau_avg_weight'], 'bfill', limit=2)
+
+    avg_weight, count = store.align(store.MonthlyStore.from_frame(weights), store.MonthlyStore.from_frame(slau_count))
+    weight = store.multiply(avg_weight, count, 1000)
+    imputed = store.either(store.MonthlyStore.from_frame(weight_imputed, dtype=bool),
+                           store.MonthlyStore.from_frame(count_imputed, dtype=bool))
+    slau_weight2 = store.melt({'average_weight': avg_weight, 'count_in_thousand': count, 'weight': weight,
+                               'imputed': imputed}, dropna=True)
+    slau_weight2['weight_in_million'] = slau_weight2['weight'] / 1000000
+    slau_weight2['Year'] = slau_weight2['Month'].dt.to_period('Y')
+    slau_weight3 = transform.yearly_totals(
+        slau_weight2, ['average_weight', 'count_in_thousand', 'weight', 'weight_in_million'], by='Types',
+        imputed=slau_weight2['imputed'])
+    slau_weight3['weight_in_billion'] = slau_weight3['weight_in_million'] * slau_weight3['scale'] / 1000
+    return {'slau_count': slau_count, 'slau_weight2': slau_weight2, 'slau_weight3': slau_weight3}
+
+
+# pipeline name -> (tables from ingest.SHEETS, prepare)
+PIPELINES = {
+    'production': (['meat_prod'], production),
+    'slaughter': (['slau_count', 'slau_avg_weight'], slaughter),
+}
+
+
+def main(workbook=WORKBOOK):
+    for name, (tables, prepare) in PIPELINES.items():
+        inputs = {}
+        for table in tables:
+            inputs[table], unparsed = ingest.load_table(workbook, table, unparsed=True)
+            if len(unparsed):
+                print('{}: {}'.format(table, ingest.describe_unparsed(unparsed)))
+        outputs, changed = refresh(name, inputs, prepare)
+        if changed.empty:
+            print('{}: up to date'.format(name))
+        else:
+            print('{}: {} months changed, {} to {}'.format(
+                name, len(changed), changed.min().strftime('%b-%Y'), changed.max().strftime('%b-%Y')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
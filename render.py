@@ -0,0 +1,293 @@
+"""Headless rendering of the report charts.
+
+Every chart of the analysis is drawn on the Agg backend and written to
+``figures/`` as PNG and SVG. The charts are independent, so each one renders
+in its own worker process, and a chart is skipped when the hash of the data
+it plots (and of the code that draws it) matches the last render.
+
+    python render.py                   # every chart as PNG and SVG into figures/
+    python render.py -f png --force    # PNG only, re-rendering unchanged charts
+"""
+
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import instrument
+import percapita
+import refresh
+import store
+
+
+class _Lazy:
+    """Module imported on first attribute access, after ``setup()``."""
+
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            if self._setup is not None:
+                self._setup()
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def _headless():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+# matplotlib and seaborn take longer to import than pandas, and only drawing needs them
+plt = _Lazy('matplotlib.pyplot', _headless)
+sns = _Lazy('seaborn', _headless)
+
+FIGURE_DIR = 'figures'
+FORMATS = ('png', 'svg')
+MANIFEST = '.render.json'
+
+# label order of the post-1990 slaughter weight chart
+SLAUGHTER_TYPES = {'broilers': '2. broilers', 'cattle': '1. cattle', 'sheep_and_lambs': '2. sheep_and_lambs',
+                   'hogs': '4. hogs', 'turkeys': '5. turkeys', 'calves': '6. calves'}
+
+
+def _monthly_ticks(g, months):
+    # a tick every five years, at the years ending in 0 or 5
+    years = sorted(months[months.dt.month == 1].dt.year.unique())[4::5]
+    g.set(xticks=pd.to_datetime([str(y) for y in years]), xticklabels=[str(y) for y in years])
+
+
+def _yearly_ticks(g, years):
+    labels = sorted(years.unique())[::5]
+    g.set(xticks=labels, xticklabels=[str(y) for y in labels])
+
+
+def label_ends(ax, df, y, x='Year', by='Types', dy=0):
+    """Write the ``y`` value at the first and last ``x`` of every ``by`` group (of the whole frame for None).
+
+    The points come out of one groupby pass (``idxmin``/``idxmax`` of ``x``)
+    and the labels are added together, ``dy`` above the points, so the cost
+    does not grow with a scan of the frame per type.
+    """
+    df = df[df[y].notna()].reset_index(drop=True)
+    keys = df[by] if by is not None else np.zeros(len(df), dtype=np.int8)
+    years = df[x].groupby(keys, sort=False, observed=True)
+    rows = np.unique(np.concatenate([years.idxmin().to_numpy(), years.idxmax().to_numpy()]))
+    xs, ys = df[x].to_numpy()[rows], df[y].to_numpy(dtype=float)[rows]
+    return [ax.text(x=px, y=py + dy, s=str(int(py))) for px, py in zip(xs.tolist(), ys.tolist())]
+
+
+def meat_production_monthly(meat_prod):
+    g = sns.relplot(data=store.MonthlyStore.from_frame(meat_prod).melt(), x='Month', y='value',
+                    kind='line', hue='Types', height=6, aspect=2)
+    _monthly_ticks(g, meat_prod['Month'])
+    g.set(xlabel='Year', ylabel='Pounds (Million)', title='Meat Production')
+    return g.figure
+
+
+def meat_production_yearly(meat_prod3):
+    g = sns.relplot(data=meat_prod3.rename(columns={'variable': 'Types'}),
+                    x='Year', y='value_in_billion', kind='line', hue='Types', height=6, aspect=2)
+    g.set(xlabel='Year', ylabel='Pounds (Billion)', title='Meat Production')
+    return g.figure
+
+
+def meat_production_since_1990(meat_prod3):
+    meat_prod4 = meat_prod3[meat_prod3['Year'] >= 1990].rename(columns={'variable': 'Types'})
+    g = sns.relplot(data=meat_prod4, x='Year', y='value_in_billion', kind='line', hue='Types', height=6)
+    _yearly_ticks(g, meat_prod4['Year'])
+    g.set(xlabel='Year', ylabel='Pounds (Billion)', title='Meat Production')
+    label_ends(g.ax, meat_prod4, 'value_in_billion')
+    return g.figure
+
+
+def slaughter_counts(slau_count):
+    g = sns.relplot(data=store.MonthlyStore.from_frame(slau_count).melt(), x='Month', y='value',
+                    kind='line', hue='Types', height=6, aspect=2)
+    _monthly_ticks(g, slau_count['Month'])
+    g.set(xlabel='Year', ylabel='1,000 Head', title='Slaughter Counts')
+    return g.figure
+
+
+def slaughter_weight_monthly(slau_weight2):
+    g = sns.relplot(data=slau_weight2, x='Month', y='weight_in_million', kind='line', hue='Types',
+                    height=6, aspect=2)
+    _monthly_ticks(g, slau_weight2['Month'])
+    g.set(xlabel='Year', ylabel='Million Pounds', title='Slaughter Weight')
+    return g.figure
+
+
+def slaughter_weight_since_1990(slau_weight3):
+    slau_weight4 = slau_weight3[slau_weight3['Year'] >= 1990].replace({'Types': SLAUGHTER_TYPES})
+    g = sns.relplot(data=slau_weight4.sort_values('Types'), x='Year', y='weight_in_billion',
+                    kind='line', hue='Types', height=6)
+    _yearly_ticks(g, slau_weight4['Year'])
+    g.set(xlabel='Year', ylabel='Pounds (Billion)', title='Slaughter Weight (Carcass Weight)')
+    label_ends(g.ax, slau_weight4, 'weight_in_billion')
+    return g.figure
+
+
+def us_population(pop):
+    df = pop.assign(**{'Population (Millions)': pop['Pop'] / 1000000})
+    g = sns.relplot(data=df, x='Year', y='Population (Millions)', kind='line')
+    g.set(ylim=(0, None), title='US Population')
+    label_ends(g.ax, df, 'Population (Millions)', by=None, dy=-15)
+    return g.figure
+
+
+def meat_production_per_capita(meat_prod_per_capita):
+    df = store.MonthlyStore.from_frame(meat_prod_per_capita).melt(dropna=True)
+    g = sns.relplot(data=df, x='Month', y='value', kind='line', hue='Types', height=6, aspect=2)
+    _monthly_ticks(g, df['Month'])
+    g.set(xlabel='Year', ylabel='Pounds per Person', title='Meat Production per Capita')
+    return g.figure
+
+
+def slaughter_weight_per_capita(slau_weight_per_capita):
+    df = store.MonthlyStore.from_frame(slau_weight_per_capita).melt(dropna=True)
+    g = sns.relplot(data=df, x='Month', y='value', kind='line', hue='Types', height=6, aspect=2)
+    _monthly_ticks(g, df['Month'])
+    g.set(xlabel='Year', ylabel='Pounds per Person (Live Weight)', title='Slaughter Weight per Capita')
+    return g.figure
+
+
+# chart name -> (frames it plots, function drawing it)
+FIGURES = {
+    'meat_production_monthly': (['meat_prod'], meat_production_monthly),
+    'meat_production_yearly': (['meat_prod3'], meat_production_yearly),
+    'meat_production_since_1990': (['meat_prod3'], meat_production_since_1990),
+    'slaughter_counts': (['slau_count'], slaughter_counts),
+    'slaughter_weight_monthly': (['slau_weight2'], slaughter_weight_monthly),
+    'slaughter_weight_since_1990': (['slau_weight3'], slaughter_weight_since_1990),
+    'us_population': (['population'], us_population),
+    'meat_production_per_capita': (['meat_prod_per_capita'], meat_production_per_capita),
+    'slaughter_weight_per_capita': (['slau_weight_per_capita'], slaughter_weight_per_capita),
+}
+
+
+def _render(name, frames, out_dir, formats):
+    sns.set_style('darkgrid')
+    keys, draw = FIGURES[name]
+    fig = draw(*[frames[k] for k in keys])
+    paths = []
+    for fmt in formats:
+        paths.append(os.path.join(out_dir, '{}.{}'.format(name, fmt)))
+        fig.savefig(paths[-1], format=fmt, bbox_inches='tight')
+    plt.close(fig)
+    return paths
+
+
+# code every chart goes through besides its own drawing function: backend and style setup, ticks, labels
+HELPERS = [_headless, _render, _monthly_ticks, _yearly_ticks, label_ends]
+
+
+def figure_hash(name, frames):
+    """Digest of the function drawing ``name``, of the ``HELPERS`` and of every frame it plots."""
+    keys, draw = FIGURES[name]
+    digest = hashlib.sha256()
+    for func in [draw] + HELPERS:
+        digest.update(inspect.getsource(func).encode())
+    for key in keys:
+        frame = frames[key]
+        digest.update(json.dumps([str(c) for c in frame.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render(frames, out_dir=FIGURE_DIR, formats=FORMATS, force=False, max_workers=None):
+    """Render every chart whose frames are in ``frames``, in parallel; return ``{name: paths or None}``.
+
+    Charts whose hash matches the last render and whose files all exist map
+    to None.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    todo, done = {}, {}
+    for name, (keys, _) in FIGURES.items():
+        if not all(k in frames for k in keys):
+            continue
+        digest = figure_hash(name, frames)
+        files = [os.path.join(out_dir, '{}.{}'.format(name, fmt)) for fmt in formats]
+        if not force and manifest.get(name) == digest and all(os.path.exists(p) for p in files):
+            done[name] = None
+        else:
+            todo[name] = digest
+
+    if todo:
+        with ProcessPoolExecutor(max_workers or len(todo)) as pool:
+            rec = instrument.active()
+            futures = {}
+            for name in todo:
+                args = (name, {k: frames[k] for k in FIGURES[name][0]}, out_dir, formats)
+                if rec is None:
+                    futures[name] = pool.submit(_render, *args)
+                else:
+                    futures[name] = pool.submit(instrument.capture, 'figure:' + name, _render, args,
+                                                trace_memory=rec.trace_memory, profile=rec.profile)
+            for name, future in futures.items():
+                if rec is None:
+                    done[name] = future.result()
+                else:
+                    done[name], records, slowest = future.result()
+                    rec.extend(records, slowest)
+                manifest[name] = todo[name]
+        with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    return done
+
+
+def load_frames(workbook=refresh.WORKBOOK, with_population=True):
+    """Frames the charts plot: the refreshed USDA pipelines and, when the Census answers, population and per capita."""
+    import census
+    import population
+
+    frames = {}
+    for name, (tables, prepare) in refresh.PIPELINES.items():
+        outputs, _ = refresh.refresh(name, {t: ingest.load_table(workbook, t) for t in tables}, prepare)
+        frames.update(outputs)
+    if with_population:
+        try:
+            with census.Fetcher(max_workers=16, rate=50, cache=census.ResponseCache()) as client:
+                frames['population'], _ = population.yearly_population(client)
+        except (census.CacheMiss, OSError) as e:
+            print('us_population: skipped, {}'.format(e))
+        else:
+            frames.update(percapita.cached_per_capita(workbook, frames['meat_prod'], frames['slau_weight2'],
+                                                      frames['population']))
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--out', default=FIGURE_DIR, help='output directory (default: %(default)s)')
+    parser.add_argument('-f', '--format', action='append', choices=['png', 'svg', 'pdf'],
+                        help='output format, repeatable (default: png and svg)')
+    parser.add_argument('-w', '--workbook', default=refresh.WORKBOOK)
+    parser.add_argument('--no-population', action='store_true', help='skip the Census population chart')
+    parser.add_argument('--force', action='store_true', help='re-render charts whose data did not change')
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.workbook, not args.no_population)
+    for name, paths in render(frames, args.out, tuple(args.format or FORMATS), args.force).items():
+        print('{}: {}'.format(name, 'unchanged' if paths is None else ', '.join(paths)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
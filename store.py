@@ -0,0 +1,184 @@
+"""Compact container for monthly series of several types.
+
+A long (melted) frame repeats a full Month timestamp and an object label on
+every value. ``MonthlyStore`` keeps the months once, as int32 ordinals of
+``period[M]`` (months since Jan-1970), and the values as one 2-D block with
+a column per type, so a table of a century of months costs 4 bytes per month
+plus 4 or 8 bytes per value whatever the number of types. Long frames are only
+built by ``melt``, at the seaborn boundary, with categorical type labels.
+Two stores on the same calendar are joined by ``align``, which lines them up
+by month offset and type position instead of hashing Month/Types keys.
+"""
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+MONTH_DTYPE = pd.PeriodDtype('M')
+
+
+def month_ordinals(months):
+    """int32 month ordinals of datetimes, periods or anything ``pd.to_datetime`` reads."""
+    months = pd.Index(months)
+    if not isinstance(months.dtype, pd.PeriodDtype):
+        months = pd.DatetimeIndex(pd.to_datetime(months)).to_period('M')
+    return months.asfreq('M').asi8.astype(np.int32)
+
+
+class MonthlyStore:
+    """Monthly values of several types on one shared month index.
+
+    ``months`` holds sorted int32 month ordinals, ``values`` a float array
+    of shape ``(len(months), len(types))`` with NaN for missing months and
+    ``types`` the column labels.
+    """
+
+    __slots__ = ('months', 'values', 'types')
+
+    def __init__(self, months, values, types):
+        self.months = np.asarray(months, dtype=np.int32)
+        self.values = np.asarray(values)
+        self.types = pd.Index(types)
+        if self.values.shape != (len(self.months), len(self.types)):
+            raise ValueError('values of shape {} do not match {} months and {} types'.format(
+                self.values.shape, len(self.months), len(self.types)))
+
+    @classmethod
+    def from_frame(cls, df, date_col='Month', dtype=np.float64):
+        """Store a wide frame with one column per type, dated by ``date_col`` or its index."""
+        if date_col in df.columns:
+            months, df = month_ordinals(df[date_col]), df.drop(columns=date_col)
+        else:
+            months = month_ordinals(df.index)
+        order = np.argsort(months, kind='stable')
+        return cls(months[order], df.to_numpy(dtype=dtype)[order], df.columns)
+
+    @classmethod
+    def from_long(cls, df, value_name, var_name='Types', date_col='Month', dtype=np.float64):
+        """Store the ``value_name`` column of a long frame, one column per ``var_name`` label."""
+        months, month_codes = np.unique(month_ordinals(df[date_col]), return_inverse=True)
+        type_codes, types = pd.factorize(df[var_name], sort=True)
+        values = np.full((len(months), len(types)), np.nan, dtype=dtype)
+        values[month_codes, type_codes] = df[value_name].to_numpy(dtype=dtype)
+        return cls(months, values, pd.Index(np.asarray(types, dtype=object)))
+
+    def __len__(self):
+        return len(self.months)
+
+    def __repr__(self):
+        if not len(self):
+            return '<MonthlyStore: empty, {} types>'.format(len(self.types))
+        return '<MonthlyStore: {} months {} to {}, {} types, {} bytes>'.format(
+            len(self), self.periods[0], self.periods[-1], len(self.types), self.nbytes)
+
+    def __getitem__(self, label):
+        return pd.Series(self.values[:, self.types.get_loc(label)], index=self.index, name=label)
+
+    @property
+    def nbytes(self):
+        return self.months.nbytes + self.values.nbytes
+
+    @property
+    def periods(self):
+        return pd.PeriodIndex(pd.arrays.PeriodArray(self.months.astype(np.int64), dtype=MONTH_DTYPE))
+
+    @property
+    def index(self):
+        """Month start timestamps, the ``Month`` column of the USDA tables."""
+        return self.periods.to_timestamp().rename('Month')
+
+    @property
+    def years(self):
+        return self.months // 12 + 1970
+
+    def select(self, types):
+        """Store of the ``types`` columns only, in that order."""
+        return MonthlyStore(self.months, self.values[:, self.types.get_indexer_for(types)], types)
+
+    def to_frame(self, date_col='Month'):
+        """The wide frame again: ``date_col`` and a column per type."""
+        df = pd.DataFrame(self.values, columns=self.types)
+        df.insert(0, date_col, self.index)
+        return df
+
+    def ravel(self):
+        """Values flattened in the row order of ``melt``."""
+        return self.values[:, _type_order(self.types)].ravel()
+
+    def melt(self, var_name='Types', value_name='value', dropna=False):
+        """Long frame sorted by month, then type, as ``pd.melt`` followed by a sort would give.
+
+        The type column is categorical with the labels in sorted order.
+        """
+        return melt({value_name: self}, var_name, dropna)
+
+
+def _type_order(types):
+    return np.argsort(np.asarray(types, dtype=object), kind='stable')
+
+
+@instrument.timed('merge')
+def align(left, right):
+    """``left`` and ``right`` cut down to the months and types they share, row for row and column for column.
+
+    Both sit on the same monthly calendar, so months are matched by their
+    offset from the earliest one rather than hashed: the cost grows linearly
+    with the months and types held.
+    """
+    types = left.types[left.types.isin(right.types)]
+    if not len(left) or not len(right):
+        months = np.empty(0, dtype=np.int32)
+        return (MonthlyStore(months, np.empty((0, len(types)), left.values.dtype), types),
+                MonthlyStore(months, np.empty((0, len(types)), right.values.dtype), types))
+
+    start = min(left.months[0], right.months[0])
+    span = max(left.months[-1], right.months[-1]) - start + 1
+    rows = np.full((2, span), -1, dtype=np.int64)
+    rows[0, left.months - start] = np.arange(len(left))
+    rows[1, right.months - start] = np.arange(len(right))
+    shared = rows[:, (rows >= 0).all(axis=0)]
+    months = left.months[shared[0]]
+    return (MonthlyStore(months, left.values[np.ix_(shared[0], left.types.get_indexer(types))], types),
+            MonthlyStore(months, right.values[np.ix_(shared[1], right.types.get_indexer(types))], types))
+
+
+@instrument.timed('multiply')
+def multiply(left, right, scale=1):
+    """``left * right * scale`` over the months and types both hold, into one preallocated array."""
+    left, right = align(left, right)
+    out = np.empty(left.values.shape, dtype=np.result_type(left.values, right.values))
+    np.multiply(left.values, right.values, out=out)
+    if scale != 1:
+        out *= scale
+    return MonthlyStore(left.months, out, left.types)
+
+
+def either(left, right):
+    """Boolean store flagging the shared cells set in ``left`` or in ``right``."""
+    left, right = align(left, right)
+    return MonthlyStore(left.months, left.values.astype(bool) | right.values.astype(bool), left.types)
+
+
+@instrument.timed('melt')
+def melt(columns, var_name='Types', dropna=False):
+    """Long frame of aligned stores, one value column per ``{name: store}`` in ``columns``.
+
+    Rows run by month, then by type in sorted order, with a categorical type
+    column. ``dropna`` keeps only the rows where every column has a value.
+    """
+    first = next(iter(columns.values()))
+    for other in columns.values():
+        if not (np.array_equal(other.months, first.months) and other.types.equals(first.types)):
+            raise ValueError('stores must share months and types, align them first')
+    order = _type_order(first.types)
+    codes = np.tile(np.arange(len(order), dtype=np.int8 if len(order) < 128 else np.int32), len(first))
+    df = pd.DataFrame({
+        'Month': np.repeat(first.index.to_numpy(), len(order)),
+        var_name: pd.Categorical.from_codes(codes, categories=np.asarray(first.types, dtype=object)[order]),
+    })
+    for name, store in columns.items():
+        df[name] = store.ravel()
+    if dropna:
+        df = df[df[list(columns)].notna().all(axis=1).to_numpy()].reset_index(drop=True)
+    return df
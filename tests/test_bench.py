@@ -0,0 +1,60 @@
+"""The Census sweeps replay what the synthetic API answers; transform and merge run on any history."""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bench
+import census
+import ingest
+import population
+
+
+def test_replayed_recording_matches_the_synthetic_api(tmp_path):
+    path = bench.census_recording(cps_rows=20, bench_dir=str(tmp_path))
+    with bench.ReplayServer(path) as server, census.Fetcher(max_workers=8, rate=None) as client:
+        df, misses = population.yearly_population(client, server.base_url)
+        counts, cps_misses = population.cps_counts(client, server.base_url)
+
+    # every year but the 2020 vintage, which the synthetic API lacks like the real one
+    assert list(df['Year']) == [y for y in range(1990, 2022) if y != 2020]
+    assert df['Pop'].is_monotonic_increasing
+    assert list(misses) == [2020] and not cps_misses
+
+    # the age variable is A_AGE up to Mar-1994 and PRTAGE after
+    assert set(counts) == {(y, m) for y in population.CPS_YEARS for m in population.CPS_MONTHS}
+    for (year, month), n in counts.items():
+        variable = 'A_AGE' if (year, population.CPS_MONTHS.index(month)) < (1994, 3) else 'PRTAGE'
+        status, body = bench.synthetic_response('/data/{}/cps/basic/{}?get={}'.format(year, month, variable),
+                                                cps_rows=20)
+        assert status == 200 and n == len(json.loads(body))
+
+
+def test_census_server_needs_a_respond():
+    with pytest.raises(TypeError):
+        bench._CensusServer()
+
+
+def test_transform_and_merge_run_past_2262(tmp_path, monkeypatch):
+    pytest.importorskip('openpyxl')
+    # the last years of a long history: sheets from 2250 to 2270
+    monkeypatch.setattr(bench, 'LAYOUT', {name: (title, corner, 2250, blocks)
+                                          for name, (title, corner, _, blocks) in bench.LAYOUT.items()})
+    monkeypatch.setattr(bench, 'LAST_MONTH', pd.Period('2270-12', 'M').ordinal)
+    path = str(tmp_path / 'usda.xlsx')
+    bench.synthetic_workbook(path)
+    specs = bench.sheet_specs()
+    frames = {name: bench.sheet_frame(path, spec) for name, spec in specs.items()}
+    frame = frames['meat_prod']
+    assert frame.index[-1] == pd.Timestamp('2270-12-01') and str(frame.index.dtype) == 'datetime64[s]'
+    # the streamed table, months past the end of datetime64[ns] included
+    values = ingest.stream_table(path, **specs['meat_prod'])[0]
+    np.testing.assert_array_equal((frame.index.year - 1970) * 12 + frame.index.month - 1, values.months)
+    np.testing.assert_array_equal(frame.to_numpy(), values.values)
+    assert frame.columns.tolist() == specs['meat_prod']['columns']
+
+    assert bench._stage('transform', path, 1, None, False)['rows'] == len(frame)
+    assert bench._stage('merge', path, 1, None, False)['rows'] == \
+        len(frames['slau_count']) + len(frames['slau_avg_weight'])
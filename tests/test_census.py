@@ -0,0 +1,192 @@
+"""Census client: cache TTLs, the streaming row count and retries, caching and offline mode against a stub server."""
+
+import gzip
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+
+import pytest
+
+import census
+
+BASE = 'https://api.census.gov/data'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = census.ResponseCache(str(tmp_path / 'census.sqlite'), offline=False)
+    yield cache
+    cache.close()
+
+
+def age(cache, url, seconds):
+    cache.db.execute('UPDATE responses SET stored = ? WHERE key = ?', (time.time() - seconds, census.cache_key(url)))
+    cache.db.commit()
+
+
+@pytest.mark.parametrize('dataset', ['1994/cps/basic/apr', '2019/pep/population', '2000/pep/int_population',
+                                     '2014/pep/natstprc', '2012/popproj/pop'])
+def test_variable_lists_expire_where_the_data_never_does(cache, dataset):
+    variables = '{}/{}/variables.json'.format(BASE, dataset)
+    data = '{}/{}?get=POP&for=us:*&key=abc'.format(BASE, dataset)
+    assert cache.ttl(variables) == 30 * census.DAY
+    assert cache.ttl(data) is None
+
+    for url in (variables, data):
+        cache.put(url, 200, b'[]')
+        age(cache, url, 31 * census.DAY)
+    assert cache.get(variables) is None
+    assert cache.get(data) == (200, b'[]')
+
+
+def rows_of(body, chunk_size):
+    return census.count_rows(io.BytesIO(body), chunk_size)
+
+
+BODIES = [
+    [['A_AGE']],
+    [['PRTAGE'], ['45'], ['3'], ['90']],
+    [['NAME', 'POP'], ['[United, States]', '1,000'], ['{a}', '2']],
+    [['NAME'], ['say \\"[hi]\\"'], ['back\\\\'], ['"],[']],
+    [['NAME', 'X'], ['\\\\\\"', '[[[]]]'], ['', ','], ['é[', None]],
+]
+
+
+@pytest.mark.parametrize('rows', BODIES)
+def test_count_rows_matches_json_loads(rows):
+    body = json.dumps(rows, ensure_ascii=False).encode()
+    assert json.loads(body) == rows
+    # every chunk size up to the body, so chunks end inside strings, escapes and multi-byte characters
+    for chunk_size in list(range(1, len(body) + 1)) + [1 << 20]:
+        assert rows_of(body, chunk_size) == len(rows), chunk_size
+
+
+def test_count_rows_of_an_empty_body():
+    assert rows_of(b'', 4) == 0
+    assert rows_of(b'[]', 4) == 0
+    assert rows_of(b' [ [ "A_AGE" ] ]\n', 3) == 1
+
+
+class StubServer:
+    """Local HTTP server answering each path from a list of ``(status, body, headers)``, the last one repeating."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.hits = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                stub.hits.append(path)
+                answers = stub.responses[path]
+                status, body, headers = answers.pop(0) if len(answers) > 1 else answers[0]
+                if status < 300 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body, headers = gzip.compress(body), dict(headers, **{'Content-Encoding': 'gzip'})
+                self.send_response(status)
+                for name, value in dict(headers, **{'Content-Length': str(len(body))}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = 'http://127.0.0.1:{}/data'.format(self.server.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def ok(rows):
+    return 200, json.dumps(rows).encode(), {}
+
+
+CPS = [['PRTAGE']] + [[str(age)] for age in range(5000)]
+
+
+def test_fetcher_counts_gzipped_rows_and_caches_only_the_count(cache):
+    with StubServer({'/data/2021/cps/basic/jan': [ok(CPS)]}) as server, \
+            census.Fetcher(rate=None, cache=cache) as client:
+        url = server.base_url + '/2021/cps/basic/jan?get=PRTAGE&key=abc'
+        assert client.count_rows(url) == len(CPS)
+        assert client.count_rows(url.replace('abc', 'other')) == len(CPS)
+        assert client.fetch_json(url) == CPS
+        assert server.hits == ['/data/2021/cps/basic/jan'] * 2
+    assert cache.get(url + '#rows') == (200, str(len(CPS)).encode())
+
+
+def test_fetcher_retries_transient_errors(cache):
+    responses = {'/data/flaky': [(503, b'busy', {}), (429, b'slow down', {'Retry-After': '0'}), ok([['A'], ['1']])],
+                 '/data/down': [(502, b'bad gateway', {})]}
+    with StubServer(responses) as server, census.Fetcher(rate=None, backoff=0, retries=2, cache=cache) as client:
+        assert client.fetch_json(server.base_url + '/flaky') == [['A'], ['1']]
+        with pytest.raises(HTTPError) as e:
+            client.fetch(server.base_url + '/down')
+        assert e.value.code == 502
+        assert server.hits.count('/data/flaky') == 3 and server.hits.count('/data/down') == 3
+    # transient failures are not cached
+    assert cache.get(server.base_url + '/down') is None
+
+
+def test_fetcher_caches_client_errors_for_the_error_ttl(cache):
+    responses = {'/data/2020/pep/population': [(404, b'unknown dataset', {})], '/data/denied': [(403, b'bad key', {})]}
+    with StubServer(responses) as server, census.Fetcher(rate=None, backoff=0, cache=cache) as client:
+        url = server.base_url + '/2020/pep/population?get=POP'
+        for _ in range(2):
+            with pytest.raises(HTTPError) as e:
+                client.fetch(url)
+            assert e.value.code == 404
+        for _ in range(2):
+            with pytest.raises(HTTPError):
+                client.fetch(server.base_url + '/denied')
+        # asked once, although the dataset's data is kept forever; an answer about the key is not kept
+        assert server.hits.count('/data/2020/pep/population') == 1 and server.hits.count('/data/denied') == 2
+
+        age(cache, url, census.ERROR_TTL + 1)
+        with pytest.raises(HTTPError):
+            client.fetch(url)
+        assert server.hits.count('/data/2020/pep/population') == 2
+
+
+def test_offline_serves_stale_entries_and_misses_at_once(tmp_path):
+    path = str(tmp_path / 'census.sqlite')
+    url = BASE + '/2021/pep/population/variables.json'
+    online = census.ResponseCache(path, offline=False)
+    online.put(url, 200, b'{"variables": {"POP": {}}}')
+    age(online, url, 365 * census.DAY)
+    assert online.get(url) is None
+    online.close()
+
+    offline = census.ResponseCache(path, offline=True)
+    with census.Fetcher(rate=None, cache=offline) as client:
+        # nothing listens on the base URL, any request would fail
+        assert census.SchemaResolver(client, BASE).resolve('2021/pep/population', ('NAME', 'POP'), 'POP') == 'POP'
+        with pytest.raises(census.CacheMiss):
+            client.fetch(BASE + '/2022/pep/population/variables.json')
+    offline.close()
+
+
+def test_schema_resolver_fetches_each_dataset_once(cache):
+    responses = {'/data/1994/cps/basic/mar/variables.json': [ok({'variables': {'A_AGE': {}, 'HRMONTH': {}}})],
+                 '/data/1994/cps/basic/apr/variables.json': [ok({'variables': {'PRTAGE': {}}})]}
+    with StubServer(responses) as server, census.Fetcher(rate=None, cache=cache) as client:
+        resolver = census.SchemaResolver(client, server.base_url)
+        assert resolver.resolve('1994/cps/basic/mar', 'A_AGE', 'PRTAGE') == 'A_AGE'
+        assert resolver.resolve('1994/cps/basic/apr', 'A_AGE', 'PRTAGE') == 'PRTAGE'
+        assert resolver.resolve('1994/cps/basic/mar', ('A_AGE', 'HRMONTH')) == ('A_AGE', 'HRMONTH')
+        with pytest.raises(census.VariableNotFound):
+            resolver.resolve('1994/cps/basic/apr', 'A_AGE', ('PRTAGE', 'HRMONTH'))
+        assert len(server.hits) == 2
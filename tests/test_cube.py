@@ -0,0 +1,55 @@
+"""An updated ``AggregateCube`` must hold what a cube built from scratch holds."""
+
+import numpy as np
+import pytest
+
+import cube
+import store
+
+
+def monthly(values, start=612):
+    """A store of ``values`` (a row per month) from Jan-2021 on, two types."""
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    return store.MonthlyStore(np.arange(start, start + len(values)), values, ['a', 'b'][:values.shape[1]])
+
+
+def assert_same(updated, built, metric='m'):
+    for freq in cube.FREQS:
+        got, want = updated.aggregates[metric, freq], built.aggregates[metric, freq]
+        np.testing.assert_array_equal(got[0], want[0])
+        np.testing.assert_allclose(got[1], want[1], rtol=1e-12, atol=1e-9)
+        np.testing.assert_array_equal(got[2], want[2])
+
+
+def built(values):
+    aggregates = cube.AggregateCube()
+    aggregates.update('m', values)
+    return aggregates
+
+
+def test_dropped_trailing_months():
+    aggregates = built(monthly(np.ones(24)))
+    aggregates.update('m', monthly(np.ones(18)))
+    assert_same(aggregates, built(monthly(np.ones(18))))
+    year = aggregates.table('m', 'Y').set_index('Year').loc[2022]
+    assert year['sum'] == 6 and year['months'] == 6
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_update_matches_full_build(seed, tmp_path):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(0, 10, (int(rng.integers(2, 60)), 2))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    old = values[:int(rng.integers(1, len(values) + 1))].copy()
+    if len(old) > 3:
+        old[int(rng.integers(0, len(old)))] += 1
+    if rng.random() < 0.5:
+        # the new release may also be shorter than the saved one
+        old, values = values, old
+
+    aggregates = built(monthly(old))
+    aggregates.save(str(tmp_path / 'cube.npz'))
+    aggregates = cube.AggregateCube.load(str(tmp_path / 'cube.npz'))
+    aggregates.update('m', monthly(values))
+    assert_same(aggregates, built(monthly(values)))
+    assert aggregates.update('m', monthly(values)) is None
@@ -0,0 +1,160 @@
+"""Sheet normalization: header anchors, footnote cut-off, batches, both readers, the cache and releases."""
+
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+SHEET = 'SlaughterWeights-Full'
+ROWS = [
+    ['Livestock and poultry live and dressed weights (pounds)'],
+    ['Weight and species 1/', 'Commercial average live 2/', None, None, 'Federally inspected average live', None,
+     None, 'Federally inspected average dressed 3/', None],
+    [None, 'Cattle', 'Hogs', None, 'Cattle', '--Hogs 4/', 'Broilers 5/', 'Cattle', 'Hogs'],
+    ['Jan-Mar 2022', 1, 2, None, 3, 4, 5, 6, 7],
+    ['Mar-2022', 1370, 290, None, 1380, 291, 6.5, 830, 212],
+    ['Feb-2022', 1360, 289, None, 1370, '(NA)', 6.4, 829, 211],
+    ['Jan-2022', 1350, 288, None, 1360, '1,289.5', None, 828, 210],
+    [2021, 16000, 3400, None, 16100, 3410, 77, 9900, 2500],
+    ['Dec-2021', 1340, 287, None, 1350, 288, 6.3, 827, 209],
+    ['1/ Excludes slaughter on farms.'],
+    ['Source: USDA, "Livestock Slaughter", Nov-2022.'],
+]
+
+
+def write(path, rows):
+    book = openpyxl.Workbook()
+    book.active.title = 'Contents'
+    ws = book.create_sheet(SHEET)
+    for row in rows:
+        ws.append(row)
+    ws.merge_cells('B2:D2')
+    ws.merge_cells('E2:G2')
+    ws.merge_cells('H2:I2')
+    book.save(path)
+    return path
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    return write(str(tmp_path / 'usda.xlsx'), ROWS)
+
+
+SPEC = dict(sheet_name=SHEET, start='Federally inspected average live', end='Federally inspected average dressed 3/',
+            columns=['cattle', 'hogs', 'broilers'])
+
+
+def test_iter_batches_reads_the_block_up_to_the_footnotes(tmp_path):
+    # a month-like row below the footnotes is not data
+    workbook = write(str(tmp_path / 'usda.xlsx'), ROWS + [['Oct-2021', 9, 9, None, 9, 9, 9, 9, 9]])
+    batches = list(ingest.iter_batches(workbook, batch_rows=3, **SPEC))
+    assert [len(months) for months, _, _ in batches] == [3, 1]
+    months = np.concatenate([b[0] for b in batches])
+    values = np.concatenate([b[1] for b in batches])
+    # sheet order, newest first; the year-to-date and yearly rows and everything below the footnotes are left out
+    assert [ingest.MONTH_NAMES[m % 12] + '-' + str(m // 12 + 1970) for m in months.tolist()] == \
+        ['Mar-2022', 'Feb-2022', 'Jan-2022', 'Dec-2021']
+    np.testing.assert_array_equal(values, [[1380, 291, 6.5], [1370, np.nan, 6.4], [1360, 1289.5, np.nan],
+                                           [1350, 288, 6.3]])
+    unparsed = pd.concat([b[2] for b in batches])
+    assert unparsed.values.tolist() == [['Feb-2022', 'hogs', '(NA)']]
+
+
+def test_header_anchors_pick_the_block(workbook, tmp_path):
+    table = ingest.normalize_sheet(workbook, SHEET, 'Commercial average live 2/', ['hogs', 'cattle'],
+                                   end='Federally inspected average live', cache_dir=str(tmp_path / 'cache'))
+    assert table.columns.tolist() == ['hogs', 'cattle']
+    assert table.loc['2022-03-01'].tolist() == [290, 1370]
+    # the last block runs to the end of the labels
+    dressed = ingest.iter_batches(workbook, SHEET, 'Federally inspected average dressed 3/', ['hogs'])
+    assert next(dressed)[1][:, 0].tolist() == [212, 211, 210, 209]
+    with pytest.raises(KeyError):
+        list(ingest.iter_batches(workbook, SHEET, 'Commercial average live 2/', ['broilers'],
+                                 end='Federally inspected average live'))
+
+
+@pytest.mark.parametrize('reader', ['stream', 'pandas'])
+def test_normalize_sheet(workbook, tmp_path, reader):
+    table, unparsed = ingest.normalize_sheet(workbook, cache_dir=str(tmp_path / 'cache'), reader=reader,
+                                             unparsed=True, **SPEC)
+    expected = pd.DataFrame([[1350, 288, 6.3], [1360, 1289.5, np.nan], [1370, np.nan, 6.4], [1380, 291, 6.5]],
+                            columns=SPEC['columns'], dtype=float,
+                            index=pd.DatetimeIndex(pd.date_range('2021-12', periods=4, freq='MS'), name='Month'))
+    pd.testing.assert_frame_equal(table, expected, check_freq=False)
+    assert unparsed['Value'].tolist() == ['(NA)']
+    # the second call comes from the cache
+    cached, again = ingest.normalize_sheet(workbook, cache_dir=str(tmp_path / 'cache'), reader=reader,
+                                           unparsed=True, **SPEC)
+    pd.testing.assert_frame_equal(cached, expected, check_freq=False)
+    assert again['Value'].tolist() == ['(NA)']
+
+
+def test_a_new_parser_version_rebuilds_the_cache(workbook, tmp_path, monkeypatch):
+    parsed = []
+    stream_table = ingest.stream_table
+    monkeypatch.setattr(ingest, 'stream_table', lambda *args: parsed.append(args) or stream_table(*args))
+    cache_dir = str(tmp_path / 'cache')
+    first = ingest.normalize_sheet(workbook, cache_dir=cache_dir, reader='stream', **SPEC)
+    ingest.normalize_sheet(workbook, cache_dir=cache_dir, reader='stream', **SPEC)
+    assert len(parsed) == 1
+
+    monkeypatch.setattr(ingest, 'code_version', lambda: 'edited')
+    pd.testing.assert_frame_equal(ingest.normalize_sheet(workbook, cache_dir=cache_dir, reader='stream', **SPEC),
+                                  first)
+    assert len(parsed) == 2
+
+
+def test_frames_round_trip_through_the_npz_cache(tmp_path):
+    df = pd.DataFrame({'Types': ['beef', 'pork', 'beef'], 'value': [1.5, np.nan, 3.0],
+                       'Vintage': pd.period_range('2022-01', periods=3, freq='M')},
+                      index=pd.DatetimeIndex(pd.date_range('2021-12', periods=3, freq='MS'), name='Month'))
+    path = str(tmp_path / 'frame.npz')
+    ingest.save_frame(path, df)
+    pd.testing.assert_frame_equal(ingest.load_frame(path), df, check_freq=False, check_dtype=False)
+    ingest.save_frame(path, ingest.coerce_cells([], [], ['beef'])[1])
+    assert ingest.load_frame(path).columns.tolist() == ['Month', 'Column', 'Value']
+    # only text columns are stored as objects
+    with pytest.raises(TypeError):
+        ingest.save_frame(path, pd.DataFrame({'label': ['Jan-2022', 3]}))
+
+
+def test_release_vintage(tmp_path):
+    assert ingest.release_vintage('data/releases/meat_statistics_2022-10.xlsx') == pd.Period('2022-10', 'M')
+    assert ingest.release_vintage('LDM_202104.xlsx') == pd.Period('2021-04', 'M')
+    # no year-month in the name, the file's modification month
+    path = tmp_path / 'meat_statistics.xlsx'
+    path.write_bytes(b'')
+    os.utime(path, (0, pd.Timestamp('2019-03-15').timestamp()))
+    assert ingest.release_vintage(str(path)) == pd.Period('2019-03', 'M')
+
+
+def test_load_releases_stacks_vintages_and_reports_broken_workbooks(tmp_path):
+    bench = pytest.importorskip('bench')
+    releases = tmp_path / 'releases'
+    releases.mkdir()
+    bench.synthetic_workbook(str(releases / 'meat_statistics_2022-10.xlsx'), seed=0)
+    bench.synthetic_workbook(str(releases / 'LDM_202104.xlsx'), seed=1)
+    (releases / 'broken_2023-01.xlsx').write_bytes(b'not a workbook')
+    (releases / '~$LDM_202104.xlsx').write_bytes(b'lock file')  # left by Excel, not a release
+
+    names = ['meat_prod', 'slau_count']
+    tables, errors = ingest.load_releases(str(releases), names, max_workers=2, cache_dir=str(tmp_path / 'cache'))
+    broken = str(releases / 'broken_2023-01.xlsx')
+    assert sorted(errors) == [(broken, name) for name in names]
+    assert all(isinstance(e, zipfile.BadZipFile) for e in errors.values())
+
+    for name in names:
+        table = tables[name]
+        assert table['Vintage'].unique().tolist() == [pd.Period('2021-04', 'M'), pd.Period('2022-10', 'M')]
+        # each release whole, in month order, oldest release first
+        for vintage, rows in table.groupby('Vintage'):
+            assert rows.index.is_monotonic_increasing
+            workbook = str(releases / ('LDM_202104.xlsx' if vintage.month == 4 else 'meat_statistics_2022-10.xlsx'))
+            pd.testing.assert_frame_equal(rows.drop(columns='Vintage'),
+                                          ingest.load_table(workbook, name, cache_dir=str(tmp_path / 'cache')))
@@ -0,0 +1,82 @@
+"""Spans nest and count rows, ``timed`` records only while recording, nested spans keep the outer memory peak."""
+
+import csv
+import json
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+
+@instrument.timed('double')
+def double(df):
+    return pd.concat([df, df])
+
+
+def test_spans_nest_and_record_rows():
+    with instrument.Recorder() as rec:
+        with instrument.span('outer', rows_in=3) as outer:
+            with instrument.span('inner') as inner:
+                inner.rows_out = 7
+            outer.rows_out = 5
+        with instrument.span('second'):
+            pass
+    # in the order they finish, nested ones first
+    assert [(r['name'], r['depth'], r['rows_in'], r['rows_out']) for r in rec.records] == \
+        [('inner', 1, None, 7), ('outer', 0, 3, 5), ('second', 0, None, None)]
+    assert rec.records[1]['wall_s'] >= rec.records[0]['wall_s'] >= 0
+    assert instrument.active() is None
+
+
+def test_timed_counts_rows_and_runs_untouched_without_a_recorder():
+    df = pd.DataFrame({'a': range(4)})
+    assert len(double(df)) == 8
+    with instrument.Recorder() as rec:
+        with instrument.span('stage'):
+            double(df)
+    assert [(r['name'], r['depth'], r['rows_in'], r['rows_out']) for r in rec.records] == \
+        [('double', 1, 4, 8), ('stage', 0, None, None)]
+    # the null span takes rows as well, and goes nowhere
+    with instrument.span('nothing') as s:
+        s.rows_out = 1
+    assert s.record is None
+
+
+def test_capture_and_extend_keep_the_depth():
+    value, records, slowest = instrument.capture('worker', double, (pd.DataFrame({'a': [1, 2]}),))
+    assert len(value) == 4 and slowest is None
+    with instrument.Recorder() as rec:
+        with instrument.span('parent'):
+            rec.extend(records, slowest)
+    assert [(r['name'], r['depth']) for r in rec.records] == [('double', 2), ('worker', 1), ('parent', 0)]
+
+
+def test_nested_spans_keep_the_outer_peak():
+    size = 8 << 20
+    with instrument.Recorder(trace_memory=True) as rec:
+        with instrument.span('outer'):
+            block = np.ones(size, dtype=np.uint8)
+            del block
+            # the peak this resets belongs to outer too
+            with instrument.span('inner'):
+                small = np.ones(size // 8, dtype=np.uint8)
+                del small
+    inner, outer = rec.records
+    assert size / 8 / 1024 <= inner['tracemalloc_peak_kb'] < size / 1024
+    assert outer['tracemalloc_peak_kb'] >= size / 1024
+
+
+def test_write_the_report(tmp_path):
+    with instrument.Recorder(profile=True) as rec:
+        with instrument.span('load', rows_in=2) as s:
+            s.rows_out = 2
+    paths = rec.write(str(tmp_path / 'report' / 'run'))
+    assert [p.rsplit('.', 1)[1] for p in paths] == ['json', 'csv', 'prof']
+    with open(paths[0]) as f:
+        report = json.load(f)
+    assert report['spans'] == rec.records and 'created' in report
+    with open(paths[1]) as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == instrument.FIELDS
+    assert (rows[0]['name'], rows[0]['depth'], rows[0]['rows_out'], rows[0]['requests']) == ('load', '0', '2', '0')
@@ -0,0 +1,40 @@
+"""Population is anchored on each July and interpolated between them; per-capita values divide by it."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import percapita
+import store
+
+POP = pd.DataFrame({'Year': [2002, 2000, 2001], 'Pop': [288000000, 282000000, 285000000]})
+
+
+def test_monthly_population_is_linear_between_julys():
+    months = store.month_ordinals(pd.date_range('2000-01', '2002-12', freq='MS'))
+    monthly = percapita.monthly_population(POP, months)
+    # a twelfth of the yearly change a month, from each July to the next
+    assert monthly[6:31].tolist() == pytest.approx(np.linspace(282000000, 288000000, 25).tolist())
+    # nothing before the first or after the last July
+    assert np.isnan(monthly[:6]).all() and np.isnan(monthly[31:]).all()
+
+
+def test_monthly_population_matches_pandas_interpolation():
+    rng = np.random.default_rng(0)
+    pop = pd.DataFrame({'Year': np.arange(1990, 2022), 'Pop': rng.integers(240, 340, 32) * 1000000})
+    index = pd.date_range('1985-01', '2025-12', freq='MS')
+    julys = pd.Series(pop['Pop'].to_numpy(dtype=float), index=pd.to_datetime(pop['Year'].astype(str) + '-07-01'))
+    expected = julys.reindex(index).interpolate('linear', limit_area='inside')
+    got = percapita.monthly_population(pop.sample(frac=1, random_state=0), store.month_ordinals(index))
+    np.testing.assert_allclose(got, expected.to_numpy(), rtol=1e-12)
+
+
+def test_per_capita_divides_every_type():
+    index = pd.date_range('2000-05', '2002-09', freq='MS', name='Month')
+    meat_prod = pd.DataFrame({'beef': np.arange(len(index)) + 2000.0, 'pork': 1800.0}, index=index)
+    out = percapita.production_per_capita(meat_prod, POP).set_index('Month')
+    population = percapita.monthly_population(POP, store.month_ordinals(index))
+    expected = meat_prod * 1000000 / population[:, None]
+    pd.testing.assert_frame_equal(out, expected, check_names=False, check_freq=False, rtol=1e-12)
+    assert out.loc['2001-07-01', 'pork'] == pytest.approx(1800e6 / 285000000)
+    assert out.loc[:'2000-06-01'].isna().all().all() and out.loc['2002-08-01':].isna().all().all()
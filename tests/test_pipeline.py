@@ -0,0 +1,59 @@
+"""A memoized stage must run again when its key moves or its output expires."""
+
+import inspect
+import json
+import os
+import time
+
+import ingest
+import pipeline
+import transform
+
+
+def stamp():
+    return {'t': time.time()}
+
+
+def run(stages, cache_dir):
+    return pipeline.Pipeline(stages, cache_dir=str(cache_dir), max_workers=1).run()
+
+
+def test_expired_output_runs_again(tmp_path):
+    stages = [pipeline.Stage('stamp', stamp, ttl=lambda: 60)]
+    first, status = run(stages, tmp_path)
+    assert status == {'stamp': 'ran'}
+    again, status = run(stages, tmp_path)
+    assert status == {'stamp': 'cached'} and again == first
+
+    (path,) = [os.path.join(tmp_path, d, 'output.json') for d in os.listdir(tmp_path)]
+    with open(path) as f:
+        meta = json.load(f)
+    meta['created'] -= 61
+    with open(path, 'w') as f:
+        json.dump(meta, f)
+    _, status = run(stages, tmp_path)
+    assert status == {'stamp': 'ran'}
+
+
+def test_population_key_follows_census_and_last_year():
+    def key(last_year):
+        (stage,) = [s for s in pipeline.analysis(last_year=last_year) if s.name == 'population']
+        return stage.key({})
+
+    assert key(2021) == key(2021) != key(2022)
+    (stage,) = [s for s in pipeline.analysis() if s.name == 'population']
+    assert 'census' in stage.code and stage.ttl() <= 6 * 3600
+
+
+def test_ingest_key_moves_with_the_parser_code(monkeypatch):
+    def key():
+        (stage,) = [s for s in pipeline.analysis() if s.name == 'meat_prod']
+        return stage.key({})
+
+    before, version = key(), ingest.code_version.__wrapped__()
+    getsource = inspect.getsource
+    # an edit to the gap filler reaches neither load_table nor normalize_sheet
+    monkeypatch.setattr(inspect, 'getsource', lambda obj: getsource(obj) + ('#' if obj is transform else ''))
+    # the parsed-table cache and the stage key move together
+    assert ingest.code_version.__wrapped__() != version
+    assert key() != before
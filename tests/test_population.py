@@ -0,0 +1,124 @@
+"""Population sweeps record failed requests and go on; the store resolves each period by source, vintage and date."""
+
+import http.client
+import socket
+from urllib.error import HTTPError, URLError
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import census
+import population
+
+BASE = 'https://api.census.gov/data'
+
+
+class StubFetcher:
+    """Census answers without a network, raising ``failures[part]`` for the URLs containing ``part``."""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def fetch_json(self, url):
+        for part, error in self.failures.items():
+            if part in url:
+                raise error
+        if url.endswith('variables.json'):
+            return {'variables': {'PRTAGE': {}, 'NAME': {}, 'POP': {}}}
+        if '/int_natrespop' in url:
+            return [['YEAR', 'TOT_POP'], ['1990', '249623000']]
+        if '/int_population' in url:
+            return [['GEONAME', 'POP', 'DATE_', 'us'], ['United States', '282162411', '2', '1']]
+        if '/2017/pep/population' in url:
+            return [['NAME', 'POP', 'us']]  # no data row
+        return [['NAME', 'POP', 'us'], ['United States', '320000000', '1']]
+
+    def count_rows(self, url):
+        self.fetch_json(url)
+        return 101
+
+    def map(self, fn, items):
+        return [fn(item) for item in items]
+
+
+CPS_FAILURES = {
+    '/jan/': census.CacheMiss('not cached and CENSUS_OFFLINE is set'),
+    '/feb?': URLError('connection refused'),
+    '/mar?': socket.timeout('timed out'),
+    '/apr?': HTTPError(BASE, 404, 'error: unknown variable', None, None),
+    '/may/': ValueError('Expecting value: line 1 column 1 (char 0)'),
+    '/jun?': http.client.IncompleteRead(b'[["PRTAGE"],'),
+}
+
+
+def test_failed_months_are_recorded():
+    counts, misses = population.cps_counts(StubFetcher(CPS_FAILURES), BASE, years=[2021])
+    assert {month: type(e) for (_, month), e in misses.items()} == \
+        {part.strip('/?'): type(e) for part, e in CPS_FAILURES.items()}
+    assert counts == {(2021, m): 101 for m in ('jul', 'aug', 'sep', 'oct', 'nov', 'dec')}
+
+
+def test_failed_vintages_are_recorded():
+    failures = {'/2016/pep/population?': URLError('connection reset'),
+                '/2018/pep/population/variables.json': census.CacheMiss('not cached')}
+    pop, misses = population.population_store(StubFetcher(failures), BASE, last_year=2019)
+    assert sorted(misses) == [2016, 2017, 2018]
+    assert isinstance(misses[2017], IndexError)
+    assert list(pop.resolve()['Year']) == [1990, 2001, 2012, 2013, 2014, 2015, 2019]
+
+
+def test_resolve_prefers_source_then_vintage_then_reference():
+    pop = population.PopulationStore()
+    pop.add('pep/population', [2010, 2011], [309000000, 311000000], vintage=2012)
+    pop.add('pep/int_population', [2010, 2011, 2012], [308000000, 310000000, 313000000], vintage=2019)
+    pop.add('pep/population', [2011], [311500000], vintage=2014)
+    pop.add('pep/population', [2012], [312000000], vintage=2014, reference='2012-04-01')
+    pop.add('pep/population', [2012], [312900000], vintage=2014, reference='2012-07-01')
+    pop.add('pep/population', [2013], [0], vintage=2015)  # a placeholder, not a value
+    pop.add('popproj/pop', [2013], [316000000], vintage=2012)
+    pop.add('pep/population', [2010], [309300000], vintage=2012, geo='06')
+
+    df = pop.resolve(provenance=True)
+    assert df.values.tolist() == [[2010, 309000000, 'pep/population', 2012],
+                                  [2011, 311500000, 'pep/population', 2014],
+                                  [2012, 312900000, 'pep/population', 2014],
+                                  [2013, 316000000, 'popproj/pop', 2012]]
+    assert pop.resolve(geo='06').values.tolist() == [[2010, 309300000]]
+    assert pop.resolve(geo='48').empty
+    assert pop.resolve(geo=None)[['Geo', 'Year']].values.tolist() == \
+        [['us', 2010], ['us', 2011], ['us', 2012], ['us', 2013], ['06', 2010]]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_resolve_matches_sorting_the_observations(seed):
+    rng = np.random.default_rng(seed)
+    pop = population.PopulationStore()
+    for _ in range(40):
+        n = int(rng.integers(1, 8))
+        reference = None if rng.random() < 0.3 else \
+            (np.datetime64('2000-01-01') + rng.integers(0, 5000, n)).astype('datetime64[D]')
+        pop.add(population.SOURCES[rng.integers(len(population.SOURCES))], rng.integers(2000, 2012, n),
+                rng.integers(0, 4, n) * 1000, vintage=int(rng.integers(2000, 2004)),
+                geo=rng.choice(['us', '06', '48'], n), reference=reference)
+
+    obs = pop.to_frame()
+    obs = obs[obs['value'] > 0].assign(rank=obs['source'].map(population.SOURCES.index),
+                                       reference=obs['reference'].fillna(pd.Timestamp.min))
+    expected = obs.sort_values(['geo', 'period', 'rank', 'vintage', 'reference'], kind='stable') \
+        .groupby(['geo', 'period']).last()
+    got = pop.resolve(geo=None, provenance=True).set_index(['Geo', 'Year'])
+    assert len(got) == len(expected)
+    for (geo, year), row in got.iterrows():
+        assert (row['Pop'], row['Source'], row['Vintage']) == \
+            tuple(expected.loc[(geo, str(year)), ['value', 'source', 'vintage']])
+
+
+def test_resolve_monthly_series():
+    pop = population.PopulationStore()
+    pop.add('pep/int_natrespop', ['2000-02', '2000-01'], [281000000, 280900000], freq='M')
+    pop.add('pep/int_natrespop', [2000], [282000000])
+    df = pop.resolve('M')
+    assert df.columns.tolist() == ['Month', 'Pop']
+    assert df['Month'].tolist() == [pd.Timestamp('2000-01-01'), pd.Timestamp('2000-02-01')]
+    assert pop.resolve()['Pop'].tolist() == [282000000]
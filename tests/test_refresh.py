@@ -0,0 +1,94 @@
+"""An incremental ``refresh`` must give what a full ``prepare`` of the same inputs gives."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+import refresh
+
+
+def table(name, start='2015-01', end='2022-12', seed=0):
+    months = pd.date_range(start, end, freq='MS', name='Month')
+    columns = ingest.SHEETS[name]['columns']
+    values = np.random.default_rng(seed).uniform(100, 200, (len(months), len(columns))).round(1)
+    return pd.DataFrame(values, index=months, columns=columns)
+
+
+def inputs(pipeline, **kwargs):
+    return {t: table(t, seed=i, **kwargs) for i, t in enumerate(refresh.PIPELINES[pipeline][0])}
+
+
+def assert_same(outputs, expected):
+    assert set(outputs) == set(expected)
+    for key in expected:
+        got, want = outputs[key], expected[key]
+        if not isinstance(want.index, pd.DatetimeIndex):
+            got, want = got.reset_index(drop=True), want.reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, want, check_dtype=False, check_categorical=False)
+
+
+def run(pipeline, old, new, state_dir):
+    prepare = refresh.PIPELINES[pipeline][1]
+    refresh.refresh(pipeline, old, prepare, state_dir=str(state_dir))
+    outputs, changed = refresh.refresh(pipeline, new, prepare, state_dir=str(state_dir))
+    assert not changed.empty
+    assert_same(outputs, prepare(new))
+    return outputs
+
+
+@pytest.mark.parametrize('pipeline', list(refresh.PIPELINES))
+def test_new_month_fills_the_previous_year(pipeline, tmp_path):
+    # Dec-2022 is empty until Jan-2023 arrives and the gap fill copies it back
+    old = inputs(pipeline)
+    for t in old.values():
+        t.loc['2022-12-01'] = np.nan
+    new = {name: pd.concat([t, pd.DataFrame(999.0, index=pd.DatetimeIndex(['2023-01-01'], name='Month'),
+                                            columns=t.columns)])
+           for name, t in old.items()}
+    outputs = run(pipeline, old, new, tmp_path)
+    if pipeline == 'production':
+        totals = outputs['meat_prod3']
+        year = totals[totals['Year'] == 2022]
+        assert (year['months'] == 12).all() and (year['scale'] == 1).all()
+
+
+@pytest.mark.parametrize('pipeline', list(refresh.PIPELINES))
+def test_revision_reaches_back_across_the_year_end(pipeline, tmp_path):
+    old = inputs(pipeline)
+    for t in old.values():
+        t.loc['2019-12-01':'2020-01-01'] = np.nan
+    new = {name: t.copy() for name, t in old.items()}
+    for t in new.values():
+        t.loc['2020-01-01'] = 5.0
+    run(pipeline, old, new, tmp_path)
+
+
+@pytest.mark.parametrize('pipeline', list(refresh.PIPELINES))
+def test_random_revisions(pipeline, tmp_path):
+    rng = np.random.default_rng(1)
+    current = inputs(pipeline)
+    prepare = refresh.PIPELINES[pipeline][1]
+    refresh.refresh(pipeline, current, prepare, state_dir=str(tmp_path))
+    for _ in range(5):
+        revised = {name: t.copy() for name, t in current.items()}
+        for t in revised.values():
+            for row in rng.integers(0, len(t), 4):
+                t.iloc[row, rng.integers(0, t.shape[1])] = rng.choice([np.nan, 5.0])
+        outputs, _ = refresh.refresh(pipeline, revised, prepare, state_dir=str(tmp_path))
+        assert_same(outputs, prepare(revised))
+        current = revised
+
+
+def test_state_from_other_code_is_rebuilt(tmp_path):
+    old = inputs('production')
+    prepare = refresh.PIPELINES['production'][1]
+    refresh.refresh('production', old, prepare, state_dir=str(tmp_path), version='old')
+
+    def doubled(tables):
+        outputs = prepare(tables)
+        outputs['meat_prod3']['value_in_billion'] *= 2
+        return outputs
+
+    outputs, _ = refresh.refresh('production', old, doubled, state_dir=str(tmp_path), version='new')
+    assert_same(outputs, doubled(old))
@@ -0,0 +1,62 @@
+"""Charts re-render when their data or drawing code changes, and only then; end labels sit on the right points."""
+
+import pandas as pd
+import pytest
+
+import render
+
+pytest.importorskip('seaborn')
+
+
+def population(pop=330000000):
+    return pd.DataFrame({'Year': [2019, 2020, 2021], 'Pop': [328000000, 329000000, pop]})
+
+
+def drawn(frames, out_dir):
+    return {name: paths is not None for name, paths in render.render(frames, str(out_dir), ('png',),
+                                                                      max_workers=1).items()}
+
+
+def test_unchanged_charts_are_skipped(tmp_path, monkeypatch):
+    assert drawn({'population': population()}, tmp_path) == {'us_population': True}
+    assert drawn({'population': population()}, tmp_path) == {'us_population': False}
+    assert drawn({'population': population(331000000)}, tmp_path) == {'us_population': True}
+
+    # a changed helper, e.g. the style set in _render, redraws every chart
+    def label_ends(ax, df, y, x='Year', by='Types', dy=0):
+        return []
+
+    monkeypatch.setattr(render, 'HELPERS', render.HELPERS[:-1] + [label_ends])
+    assert drawn({'population': population(331000000)}, tmp_path) == {'us_population': True}
+
+
+class Axes:
+    """Records ``text`` calls instead of drawing them."""
+
+    def __init__(self):
+        self.texts = []
+
+    def text(self, x, y, s):
+        self.texts.append((x, y, s))
+        return s
+
+
+def test_label_ends_writes_the_first_and_last_value_of_each_series():
+    df = pd.DataFrame({
+        'Year': [1991, 1990, 1992, 1990, 1991, 1992, 1993, 1991],
+        'Types': pd.Categorical(['beef', 'beef', 'beef', 'pork', 'pork', 'pork', 'pork', 'veal'],
+                                categories=['beef', 'lamb', 'pork', 'veal']),
+        'weight': [25.4, 24.9, 26.1, 16.2, 17.8, 18.3, None, 0.4],
+    })
+    ax = Axes()
+    labels = render.label_ends(ax, df, 'weight', dy=0.5)
+    # the missing 1993 pork value does not count as its last; veal has one point, labelled once; lamb has none
+    assert sorted(ax.texts) == [(1990, 16.7, '16'), (1990, 25.4, '24'), (1991, 0.9, '0'), (1992, 18.8, '18'),
+                                (1992, 26.6, '26')]
+    assert len(labels) == 5
+
+
+def test_label_ends_of_the_whole_frame():
+    ax = Axes()
+    render.label_ends(ax, population().assign(Pop=lambda d: d['Pop'] / 1e6), 'Pop', by=None, dy=-15)
+    assert ax.texts == [(2019, 313.0, '328'), (2021, 315.0, '330')]
@@ -0,0 +1,75 @@
+"""The aligned-array join must give what the ``pd.merge`` on Month/Types it replaced gave."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import store
+
+
+def wide(columns, start, periods, seed, drop=()):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=periods, freq='MS').drop(list(pd.to_datetime(drop)))
+    values = rng.uniform(1, 1000, (len(months), len(columns))).round(1)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    return pd.DataFrame(values, columns=columns).assign(Month=months)[['Month'] + columns]
+
+
+def merged(weights, counts):
+    """The notebook's join: melt both tables and merge them on Month and Types."""
+    left = pd.melt(weights, id_vars=['Month'], var_name='Types', value_name='average_weight')
+    right = pd.melt(counts, id_vars=['Month'], var_name='Types', value_name='count_in_thousand')
+    df = pd.merge(left, right, on=['Month', 'Types'])
+    df['weight'] = df['average_weight'] * df['count_in_thousand'] * 1000
+    return df.sort_values(['Month', 'Types'], ignore_index=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_align_and_multiply_match_merge(seed):
+    # shifted and holed month ranges, types only one side has, in different orders
+    weights = wide(['cattle', 'calves', 'hogs', 'broilers', 'turkeys'], '1980-01', 60, seed, drop=['1982-03'])
+    counts = wide(['turkeys', 'heifers', 'hogs', 'cattle', 'calves', 'broilers'], '1981-07', 70, seed + 100,
+                  drop=['1983-01', '1983-02'])
+    counts = counts.sample(frac=1, random_state=seed)  # from_frame sorts by month
+
+    avg_weight, count = store.align(store.MonthlyStore.from_frame(weights), store.MonthlyStore.from_frame(counts))
+    weight = store.multiply(avg_weight, count, 1000)
+    df = store.melt({'average_weight': avg_weight, 'count_in_thousand': count, 'weight': weight})
+
+    expected = merged(weights, counts)
+    assert len(df) == len(expected) == len(avg_weight) * 5
+    pd.testing.assert_frame_equal(df.assign(Types=df['Types'].astype(object)), expected, check_dtype=False)
+    # dropna as the notebook did after the merge
+    pd.testing.assert_frame_equal(
+        store.melt({'average_weight': avg_weight, 'count_in_thousand': count, 'weight': weight}, dropna=True)
+        .astype({'Types': object}), expected.dropna().reset_index(drop=True), check_dtype=False)
+
+
+def test_either_flags_cells_imputed_on_either_side():
+    left = wide(['a', 'b', 'c'], '2000-01', 24, 0).set_index('Month').notna()
+    right = wide(['c', 'a'], '2000-07', 24, 1).set_index('Month').notna()
+    flags = store.either(store.MonthlyStore.from_frame(left, dtype=bool),
+                         store.MonthlyStore.from_frame(right, dtype=bool))
+    expected = (left[['a', 'c']] | right[['a', 'c']]).dropna()
+    assert flags.values.dtype == bool and list(flags.types) == ['a', 'c']
+    np.testing.assert_array_equal(flags.values, expected.loc['2000-07':'2001-12'].to_numpy())
+
+
+def test_align_without_shared_months():
+    left = store.MonthlyStore.from_frame(wide(['a', 'b'], '2000-01', 12, 0))
+    right = store.MonthlyStore.from_frame(wide(['b'], '2001-01', 12, 1))
+    a, b = store.align(left, right)
+    assert len(a) == len(b) == 0 and list(a.types) == list(b.types) == ['b']
+    assert store.melt({'x': a, 'y': b}).empty
+
+
+def test_from_frame_and_melt_round_trip():
+    df = wide(['pork', 'beef', 'veal'], '1921-01', 30, 2)
+    stored = store.MonthlyStore.from_frame(df.set_index('Month'))
+    pd.testing.assert_frame_equal(stored.to_frame(), df)
+    long = stored.melt()
+    assert list(long['Types'].cat.categories) == ['beef', 'pork', 'veal']
+    expected = pd.melt(df, id_vars=['Month'], var_name='Types').sort_values(['Month', 'Types'], ignore_index=True)
+    pd.testing.assert_frame_equal(long.astype({'Types': object}), expected.astype({'Types': object}))
+    back = store.MonthlyStore.from_long(long, 'value')
+    np.testing.assert_array_equal(back.values, stored.values[:, [1, 0, 2]])
@@ -0,0 +1,201 @@
+"""Gap filling must agree with pandas, whole or in batches; the 1982 correction and yearly totals keep their sums."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import transform
+
+
+def table(seed, n=120, width=4, holes=0.3):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(1, 100, (n, width))
+    values[rng.random(values.shape) < holes] = np.nan
+    # a few long gaps, and series that start late and end early
+    values[10:17, 0] = np.nan
+    values[:5, 1] = np.nan
+    values[-4:, 2] = np.nan
+    months = pd.date_range('2010-01', periods=n, freq='MS', name='Month')
+    return pd.DataFrame(values, index=months, columns=['a', 'b', 'c', 'd'][:width])
+
+
+PANDAS = {
+    'ffill': lambda df, limit: df.ffill(limit=limit),
+    'bfill': lambda df, limit: df.bfill(limit=limit),
+    'linear': lambda df, limit: df.interpolate('linear', limit=limit, limit_area='inside'),
+    'time': lambda df, limit: df.interpolate('time', limit=limit, limit_area='inside'),
+}
+
+
+@pytest.mark.parametrize('method', list(PANDAS))
+@pytest.mark.parametrize('limit', [1, 2, 5])
+@pytest.mark.parametrize('seed', range(5))
+def test_fill_gaps_matches_pandas(method, limit, seed):
+    df = table(seed)
+    filled, imputed = transform.fill_gaps(df, method, limit=limit)
+    expected = PANDAS[method](df, limit)
+    pd.testing.assert_frame_equal(filled, expected, rtol=1e-12)
+    np.testing.assert_array_equal(imputed.to_numpy(), df.isna().to_numpy() & expected.notna().to_numpy())
+
+
+def test_fill_gaps_keeps_the_date_column_and_series_apart():
+    df = pd.DataFrame({'Month': pd.date_range('1982-01', periods=6, freq='MS'),
+                       'beef': [np.nan, np.nan, 3.0, np.nan, np.nan, 6.0],
+                       'veal': [1.0, np.nan, np.nan, np.nan, np.nan, np.nan]})
+    filled, imputed = transform.fill_gaps(df, 'bfill', limit=2)
+    assert filled['beef'].tolist() == [3.0, 3.0, 3.0, 6.0, 6.0, 6.0]
+    # nothing after the last veal value, and nothing leaks in from beef
+    assert filled['veal'].isna().sum() == 5
+    assert imputed.columns.tolist() == ['Month', 'beef', 'veal']
+    assert imputed['Month'].equals(df['Month'])
+    assert imputed['beef'].tolist() == [True, True, False, True, True, False]
+    assert not imputed['veal'].any()
+
+
+def test_seasonal_repeats_the_month_a_year_before():
+    values = np.arange(36, dtype=float)[:, None]
+    values[[5, 20, 21, 22]] = np.nan
+    filled, imputed = transform.fill_array(values.copy(), 'seasonal', limit=2)
+    assert np.isnan(filled[5, 0])  # no year before
+    assert filled[20, 0] == 8.0 and filled[21, 0] == 9.0 and np.isnan(filled[22, 0])
+    assert imputed[:, 0].nonzero()[0].tolist() == [20, 21]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        transform.fill_array(np.zeros((2, 1)), 'nearest')
+    with pytest.raises(ValueError):
+        transform.GapFiller('linear')
+
+
+@pytest.mark.parametrize('method', ['ffill', 'bfill', 'seasonal'])
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_gap_filler_batches_match_one_fill(method, descending, seed):
+    rng = np.random.default_rng(seed)
+    df = table(seed, n=int(rng.integers(30, 200)), holes=0.4)
+    months = np.arange(len(df), dtype=np.int32) + 480
+    limit = int(rng.integers(1, 4))
+    expected, expected_imputed = transform.fill_array(df.to_numpy(copy=True), method, limit)
+
+    step = -1 if descending else 1
+    values = df.to_numpy()[::step]
+    filler = transform.GapFiller(method, limit)
+    pieces, start = [], 0
+    while start < len(values):
+        size = int(rng.integers(1, 20))
+        pieces.append(filler.push(months[::step][start:start + size], values[start:start + size]))
+        start += size
+    pieces.append(filler.flush())
+
+    got_months = np.concatenate([p[0] for p in pieces])
+    np.testing.assert_array_equal(got_months, months[::step])
+    np.testing.assert_array_equal(np.concatenate([p[1] for p in pieces])[::step], expected)
+    np.testing.assert_array_equal(np.concatenate([p[2] for p in pieces])[::step], expected_imputed)
+
+
+def quarterly_table():
+    months = pd.date_range('1981-01', '1983-06', freq='MS')
+    df = pd.DataFrame({'Month': months, 'beef': 10.0, 'veal': 1.0, 'pork': 20.0, 'late': np.nan})
+    in_1982 = months.year == 1982
+    quarter_end = np.isin(months.month, transform.QUARTER_ENDS)
+    df.loc[in_1982 & ~quarter_end, ['beef', 'veal']] = np.nan
+    df.loc[in_1982 & quarter_end, ['beef', 'veal']] = [30.0, 3.0]
+    # one off-quarter value keeps pork monthly; 1983 has only six months listed
+    df.loc[in_1982 & ~quarter_end, 'pork'] = np.nan
+    df.loc[months == '1982-05-01', 'pork'] = 20.0
+    df.loc[months.year == 1983, 'late'] = np.where(np.isin(months[months.year == 1983].month, (3, 6)), 9.0, np.nan)
+    return df
+
+
+def test_find_quarterly_needs_a_full_year_of_quarter_ends_only():
+    assert transform.find_quarterly(quarterly_table()) == {'beef': [1982], 'veal': [1982]}
+
+
+@pytest.mark.parametrize('start', ['1975-12', '1975-09'])
+def test_find_quarterly_skips_a_monthly_series_starting_at_a_quarter_end(start):
+    months = pd.date_range('1975-01', '1977-12', freq='MS')
+    df = pd.DataFrame({'Month': months, 'beef': np.where(months >= start, 300.0, np.nan)})
+    assert transform.find_quarterly(df) == {}
+    # the first values stay whole instead of being spread over the months before them
+    out = transform.quarterly_to_monthly(df)
+    pd.testing.assert_frame_equal(out, df)
+    filled, _ = transform.fill_gaps(out, 'bfill', limit=2)
+    assert filled.loc[months >= start, 'beef'].eq(300.0).all()
+
+
+def test_quarterly_to_monthly_divides_only_the_quarterly_cells():
+    df = quarterly_table()
+    out = transform.quarterly_to_monthly(df)
+    in_1982 = df['Month'].dt.year == 1982
+    pd.testing.assert_frame_equal(out.loc[~in_1982], df.loc[~in_1982])
+    pd.testing.assert_frame_equal(out.loc[in_1982, ['pork', 'late']], df.loc[in_1982, ['pork', 'late']])
+    assert out.loc[in_1982, 'beef'].dropna().tolist() == [10.0] * 4
+    assert out.loc[in_1982, 'veal'].dropna().tolist() == [1.0] * 4
+    # the gap fill spreads each share over its quarter, and the year keeps its total
+    filled, _ = transform.fill_gaps(out, 'bfill', limit=2)
+    assert filled.loc[in_1982, 'beef'].tolist() == [10.0] * 12
+    assert transform.quarterly_to_monthly(df, {}).equals(df)
+
+
+@pytest.fixture(scope='module')
+def usda(tmp_path_factory):
+    pytest.importorskip('openpyxl')
+    import ingest
+
+    cache_dir = str(tmp_path_factory.mktemp('cache'))
+    workbook = os.path.join(os.path.dirname(__file__), '..', 'data', 'meat_statistics.xlsx')
+    return {name: ingest.load_table(workbook, name, cache_dir=cache_dir).reset_index()
+            for name in ('meat_prod', 'slau_count', 'slau_avg_weight')}
+
+
+def test_1982_columns_of_the_2022_release(usda):
+    assert transform.find_quarterly(usda['meat_prod']) == \
+        {c: [1982] for c in ('beef', 'veal', 'pork', 'lamb_and_mutton')}
+    # calves were left out of the hand-written list the detection replaced
+    assert transform.find_quarterly(usda['slau_count']) == \
+        {c: [1982] for c in ('cattle', 'heifers', 'calves', 'hogs', 'sheep_and_lambs')}
+
+
+def test_1982_values_of_the_2022_release(usda):
+    import refresh
+
+    production = refresh.production({'meat_prod': usda['meat_prod'].set_index('Month')})
+    totals = production['meat_prod3'].set_index(['Year', 'variable'])
+    raw = usda['meat_prod'][usda['meat_prod']['Month'].dt.year == 1982]
+    for column in ('beef', 'veal', 'pork', 'lamb_and_mutton'):
+        # each quarter total is spread over its three months, so the year keeps the reported total
+        assert totals.loc[(1982, column), 'value'] == pytest.approx(raw[column].sum())
+        assert totals.loc[(1982, column), 'imputed'] == 8
+    assert totals.loc[(1982, 'beef'), 'value_in_billion'] == pytest.approx(21.334)
+
+    slaughter = refresh.slaughter({name: usda[name].set_index('Month') for name in ('slau_count', 'slau_avg_weight')})
+    counts = slaughter['slau_count'].set_index('Month')
+    assert counts.loc['1982-01-01':'1982-03-01', 'calves'].tolist() == pytest.approx([233.966667] * 3)
+    assert counts.loc['1982-01-01':'1982-03-01', 'cattle'].tolist() == pytest.approx([2727.566667] * 3)
+    weights = slaughter['slau_weight3'].set_index(['Year', 'Types'])['weight_in_billion']
+    # 1.705 before calves were detected, three times their share
+    assert weights[1982, 'calves'] == pytest.approx(0.568448, abs=1e-6)
+    assert weights[1982, 'cattle'] == pytest.approx(36.32866, abs=1e-5)
+
+
+def test_yearly_totals_annualizes_only_the_last_partial_year():
+    months = pd.date_range('2019-07', '2021-09', freq='MS')
+    df = pd.concat([pd.DataFrame({'Month': months, 'Types': t, 'value': v}) for t, v in (('beef', 2.0), ('pork', 3.0))],
+                   ignore_index=True)
+    # a pork month missing in the last year, and two beef months filled by the gap fill
+    df.loc[(df['Types'] == 'pork') & (df['Month'] == '2021-05-01'), 'value'] = np.nan
+    imputed = (df['Types'] == 'beef') & df['Month'].isin(pd.to_datetime(['2020-02-01', '2021-03-01']))
+
+    totals = transform.yearly_totals(df, ['value'], 'Types', imputed=imputed).set_index(['Year', 'Types'])
+    assert totals.loc[2021, 'months'].tolist() == [9, 8]
+    assert totals.loc[2021, 'scale'].tolist() == pytest.approx([12 / 9, 12 / 8])
+    # the scaled total is what a full year at the same rate would give
+    assert (totals.loc[2021, 'value'] * totals.loc[2021, 'scale']).tolist() == pytest.approx([24.0, 36.0])
+    # 2019 started mid-year and stays as reported
+    assert totals.loc[2019, 'months'].tolist() == [6, 6] and totals.loc[2019, 'scale'].tolist() == [1.0, 1.0]
+    assert totals.loc[2020, 'value'].tolist() == [24.0, 36.0] and totals.loc[2020, 'scale'].tolist() == [1.0, 1.0]
+    assert totals['imputed'].to_dict() == {(2019, 'beef'): 0, (2019, 'pork'): 0, (2020, 'beef'): 1,
+                                           (2020, 'pork'): 0, (2021, 'beef'): 1, (2021, 'pork'): 0}
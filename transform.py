@@ -0,0 +1,212 @@
+"""Transformations shared by the production and slaughter series."""
+
+import numpy as np
+import pandas as pd
+
+import instrument
+
+QUARTER_ENDS = (3, 6, 9, 12)
+FILL_METHODS = ('ffill', 'bfill', 'linear', 'time', 'seasonal')
+
+
+def find_quarterly(df, date_col='Month'):
+    """Return ``{column: [years]}`` for series USDA only reported quarterly.
+
+    A column counts as quarterly in a year when all twelve months are listed
+    and it has values at all four quarter ends and nowhere else (1982 for
+    most red meat and livestock counts). A monthly series that starts in
+    September or December is not quarterly.
+    """
+    months = pd.to_datetime(df[date_col])
+    years = months.dt.year.to_numpy()
+    quarter_end = np.isin(months.dt.month.to_numpy(), QUARTER_ENDS)
+    columns = df.columns.drop(date_col)
+    present = df[columns].notna().to_numpy()
+
+    on_quarter = pd.DataFrame(present & quarter_end[:, None], columns=columns).groupby(years).sum()
+    off_quarter = pd.DataFrame(present & ~quarter_end[:, None], columns=columns).groupby(years).sum()
+    full_year = pd.Series(years).value_counts().reindex(on_quarter.index) == 12
+    flags = (on_quarter == len(QUARTER_ENDS)) & (off_quarter == 0) & full_year.to_numpy()[:, None]
+
+    return {c: [int(y) for y in flags.index[flags[c]]] for c in columns if flags[c].any()}
+
+
+@instrument.timed('fill gaps')
+def fill_gaps(df, method='bfill', limit=2, date_col='Month', period=12):
+    """Fill up to ``limit`` missing months in a row of every series; return ``(filled, imputed)``.
+
+    ``df`` is a wide table sorted by ``date_col`` (a column or the index)
+    with one column per series. Each column is filled on its own, all at once
+    on the 2-D array, so nothing leaks from one series into the next:
+
+    - ``ffill`` / ``bfill`` copy the last / next value into the ``limit``
+      cells after / before it, as ``DataFrame.ffill(limit=...)`` does;
+    - ``linear`` / ``time`` draw a line between the values either side of a
+      gap, by row or by date, over its first ``limit`` cells;
+    - ``seasonal`` repeats the value ``period`` rows earlier (the same month
+      a year before) over the first ``limit`` cells of a gap.
+
+    ``imputed`` is a boolean frame shaped like ``filled`` (with ``date_col``
+    copied over) that marks the cells that were filled.
+    """
+    columns = df.columns.drop(date_col, errors='ignore')
+    x = None
+    if method == 'time':
+        dates = df[date_col] if date_col in df.columns else df.index.to_series()
+        x = pd.to_datetime(dates).to_numpy().astype(np.int64).astype(float)
+    values, imputed = fill_array(df[columns].to_numpy(dtype=float, copy=True), method, limit, period, x)
+
+    filled = df.copy()
+    filled[columns] = values
+    mask = pd.DataFrame(imputed, index=df.index, columns=columns)
+    if date_col in df.columns:
+        mask.insert(0, date_col, df[date_col])
+    return filled, mask
+
+
+def fill_array(values, method='bfill', limit=2, period=12, x=None):
+    """``fill_gaps`` on a 2-D float array of chronological rows, filled in place; return ``(values, imputed)``.
+
+    ``x`` holds the row positions the ``time`` method interpolates on.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError('unknown fill method {!r}, expected one of {}'.format(method, ', '.join(FILL_METHODS)))
+    valid = ~np.isnan(values)
+    n = len(values)
+    rows = np.arange(n)[:, None]
+    cols = np.arange(values.shape[1])[None, :]
+    # row of the closest value at or above / at or below each cell, -1 / n if none
+    prev = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]
+    after_prev = rows - prev <= limit
+
+    if method == 'ffill':
+        reach = (prev >= 0) & after_prev
+        source = values[prev.clip(0), cols]
+    elif method == 'bfill':
+        reach = (nxt < n) & (nxt - rows <= limit)
+        source = values[nxt.clip(max=n - 1), cols]
+    elif method == 'seasonal':
+        back = (rows - period).clip(0)
+        reach = (rows >= period) & valid[back, cols] & after_prev
+        source = values[back, cols]
+    else:
+        x = rows.astype(float) if x is None else np.asarray(x, dtype=float)[:, None]
+        lo, hi = prev.clip(0), nxt.clip(max=n - 1)
+        reach = (prev >= 0) & (nxt < n) & after_prev
+        x0, x1 = x[lo, 0], x[hi, 0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            source = values[lo, cols] + (values[hi, cols] - values[lo, cols]) * (x[:, [0]] - x0) / (x1 - x0)
+
+    imputed = ~valid & reach
+    values[imputed] = source[imputed]
+    return values, imputed
+
+
+class GapFiller:
+    """``fill_array`` over consecutive batches of one long table, holding only the rows a fill depends on.
+
+    Batches arrive in the order of the source, oldest or newest month first
+    (the USDA sheets list the newest first); the order is taken from the first
+    two months seen. Each ``push`` returns the rows whose fill is settled,
+    as ``(months, values, imputed)`` in the order they came, and ``flush``
+    the rows still held back at the end. ``ffill`` looks ``limit`` months
+    back, ``bfill`` ``limit`` months ahead and ``seasonal`` ``period`` months
+    back, so memory stays bounded by the batch size; ``linear`` and ``time``
+    can depend on a value any distance away and are not supported.
+    """
+
+    def __init__(self, method='bfill', limit=2, period=12):
+        if method not in ('ffill', 'bfill', 'seasonal'):
+            raise ValueError('cannot fill {!r} batch by batch, expected ffill, bfill or seasonal'.format(method))
+        self.method, self.limit, self.period = method, limit, period
+        # months needed before / after a row, in calendar order
+        self.depends = (0, limit) if method == 'bfill' else (max(limit, period if method == 'seasonal' else 0), 0)
+        self.descending = None
+        self._months = np.empty(0, dtype=np.int32)
+        self._values = None
+        self._context = 0  # leading rows of the window already returned, kept to fill the next ones
+
+    def push(self, months, values):
+        months = np.asarray(months, dtype=np.int32)
+        values = np.asarray(values)
+        if self._values is None:
+            self._values = np.empty((0, values.shape[1]), dtype=values.dtype)
+        self._months = np.concatenate([self._months, months])
+        self._values = np.concatenate([self._values, values])
+        if self.descending is None:
+            if len(self._months) < 2:
+                return self._emit(0)
+            self.descending = bool(self._months[1] < self._months[0])
+        behind, ahead = self.depends[::-1] if self.descending else self.depends
+        return self._emit(len(self._months) - ahead, behind)
+
+    def flush(self):
+        return self._emit(len(self._months))
+
+    def _emit(self, stop, keep=0):
+        """Fill the window, return its rows up to ``stop`` not returned yet and keep ``keep`` of them as context."""
+        stop = max(stop, self._context)
+        if stop == self._context:
+            values = np.empty((0, 0)) if self._values is None else self._values[:0]
+            return self._months[:0], values, np.zeros(values.shape, dtype=bool)
+        step = -1 if self.descending else 1
+        filled, imputed = fill_array(self._values[::step].copy(), self.method, self.limit, self.period)
+        filled, imputed = filled[::step], imputed[::step]
+        out = self._months[self._context:stop], filled[self._context:stop], imputed[self._context:stop]
+        start = max(stop - keep, 0)
+        self._months, self._values = self._months[start:], self._values[start:]
+        self._context = stop - start
+        return out
+
+
+@instrument.timed('1982 fix')
+def quarterly_to_monthly(df, quarterly=None, date_col='Month'):
+    """Turn quarterly totals into monthly shares for every ``{column: [years]}`` in ``quarterly``.
+
+    The total sits on the last month of each quarter; dividing it by three
+    leaves the monthly share there, and the later gap fill copies it onto the
+    two empty months. Defaults to the pairs found by ``find_quarterly``.
+    """
+    if quarterly is None:
+        quarterly = find_quarterly(df, date_col)
+    if not quarterly:
+        return df.copy()
+
+    columns = list(quarterly)
+    years = pd.to_datetime(df[date_col]).dt.year.to_numpy()
+    mask = np.column_stack([np.isin(years, quarterly[c]) for c in columns])
+    values = df[columns].to_numpy(dtype=float)
+
+    out = df.copy()
+    out[columns] = np.where(mask, values / 3, values)
+    return out
+
+
+@instrument.timed('groupby')
+def yearly_totals(df, columns, by, date_col='Month', imputed=None):
+    """Sum ``columns`` per calendar year and ``by``, with a factor to annualize the latest year.
+
+    Returns one row per integer ``Year`` and ``by`` value holding the sums,
+    the number of ``months`` with a value and a ``scale`` of ``12 / months``
+    for the last year in ``df`` when it is still partial, otherwise 1.
+    Earlier short years are series that started mid-year and stay as
+    reported. Given a boolean ``imputed`` per row of ``df`` (as returned by
+    ``fill_gaps`` and melted), the number of ``imputed`` months is counted in
+    the same pass.
+    """
+    months = pd.to_datetime(df[date_col])
+    years = months.dt.year.rename('Year')
+    counts = {'months': df[columns].notna().any(axis=1).astype(int)}
+    if imputed is not None:
+        counts['imputed'] = np.asarray(imputed, dtype=int)
+
+    totals = df[columns].assign(**counts).groupby([years, df[by]], observed=True).sum().reset_index()
+    # a handful of rows per year, relabelled freely by the charts; older pandas
+    # list observed categories in order of appearance, so sort them here
+    totals[by] = totals[by].astype(object)
+    totals = totals.sort_values(['Year', by], ignore_index=True)
+    counts = totals['months'].to_numpy()
+    partial = (totals['Year'].to_numpy() == years.max()) & (counts > 0) & (counts < 12)
+    totals['scale'] = np.where(partial, 12 / np.maximum(counts, 1), 1.0)
+    return totals